@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2013-2014, Matthew Brennan Jones <matthew.brennan.jones@gmail.com>
+# Py-findlib is for finding libraries and programs on most operating systems
+# It uses a MIT style license
+# It is hosted at: https://github.com/workhorsy/py-findlib
+# 
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os, sys
+import re
+import socket
+import shutil
+import tempfile
+import threading
+import subprocess
+import logging
+import multiprocessing
+from cache_server import send_message, recv_message
+
+
+# The only compilers that clients may run. Workers should still only be
+# reachable from trusted machines, since compilers run what they are given
+allowed_compilers = ['gcc', 'g++', 'cc', 'c++', 'clang', 'clang++']
+
+# The only flags that clients may use. Anything that can run other programs,
+# load plugins, or read and write other files is not allowed. Such as -B,
+# -wrapper, -fplugin=, -specs=, -Wl,, and @file
+allowed_flags = [
+	re.compile(r'^-[cgw]$'),
+	re.compile(r'^-g(gdb|dwarf)?[0-9]?$'),
+	re.compile(r'^-O[0-3sgz]?$|^-Ofast$'),
+	re.compile(r'^-std=[a-zA-Z0-9+]+$'),
+	re.compile(r'^-(ansi|pedantic|pedantic-errors|pipe|pthread)$'),
+	re.compile(r'^-W(no-)?[a-z][a-z0-9-]*(=[a-zA-Z0-9-]+)?$'),
+	re.compile(r'^-f(?!plugin)[a-zA-Z0-9-]+(=[a-zA-Z0-9-]+)?$'),
+	re.compile(r'^-m[a-zA-Z0-9-]+(=[a-zA-Z0-9-]+)?$'),
+	re.compile(r'^-[DU][a-zA-Z_][a-zA-Z0-9_]*(=\S*)?$'),
+]
+
+# Every compile ends with these, so the worker knows where the files go
+compile_args = ['-c', '{input}', '-o', '{output}']
+
+def is_allowed_flag(flag):
+	return any(pattern.match(flag) for pattern in allowed_flags)
+
+def get_bad_arg(args):
+	# Returns the first arg that is not allowed, or None if they all are
+	if not args or os.path.basename(args[0]) not in allowed_compilers:
+		return args[0] if args else ''
+	if args[-len(compile_args) : ] != compile_args:
+		return str.join(' ', args[1 : ])
+	for flag in args[1 : -len(compile_args)]:
+		if not is_allowed_flag(flag):
+			return flag
+	return None
+
+
+class WorkerServer(object):
+	def __init__(self, hostname, port, slots = None, max_size = 256 * 1024 * 1024):
+		self.logger = logging.getLogger('build_worker')
+		self.hostname = hostname
+		self.port = port
+		self.slots = slots or multiprocessing.cpu_count()
+		self.max_size = max_size
+		self.semaphore = threading.Semaphore(self.slots)
+		self.lock = threading.Lock()
+		self.compile_count = 0
+
+	def start(self):
+		self.listen()
+		self.serve()
+
+	def listen(self):
+		self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.socket.bind((self.hostname, self.port))
+		self.socket.listen(16)
+
+		# Get the real port, if it was picked by the OS
+		self.port = self.socket.getsockname()[1]
+		self.logger.debug('Listening on port %r', self.port)
+
+	def serve(self):
+		while True:
+			conn, address = self.socket.accept()
+			t = threading.Thread(target=self.on_client_connect, args=(conn, address))
+			t.daemon = True
+			t.start()
+
+	def on_client_connect(self, conn, address):
+		try:
+			conn.settimeout(600)
+			header, data = recv_message(conn, self.max_size)
+			request = header.get('request')
+
+			if request == 'info':
+				send_message(conn, {'status' : 'ok', 'slots' : self.slots})
+			elif request == 'compile':
+				args = header['args']
+				bad_arg = get_bad_arg(args)
+				if bad_arg is not None:
+					self.logger.info('Refused to run %r from %r', bad_arg, address)
+					send_message(conn, {'status' : 'fail', 'message' : 'Argument not allowed: {0}'.format(bad_arg)})
+				else:
+					# Only run as many compilers at once as there are slots
+					with self.semaphore:
+						header, data = self._compile(args, header['extension'], data)
+					with self.lock:
+						self.compile_count += 1
+					self.logger.info('Compiled for %r', address)
+					send_message(conn, header, data)
+			else:
+				send_message(conn, {'status' : 'fail', 'message' : 'Unknown request: {0}'.format(request)})
+		except Exception:
+			self.logger.exception('Problem handling request from %r', address)
+		finally:
+			conn.close()
+
+	def _compile(self, args, extension, data):
+		# Only preprocessed sources can be compiled
+		if extension not in ['.i', '.ii']:
+			extension = '.i'
+
+		temp_dir = tempfile.mkdtemp()
+		try:
+			# Save the preprocessed source
+			in_file = os.path.join(temp_dir, 'input' + extension)
+			out_file = os.path.join(temp_dir, 'output.o')
+			with open(in_file, 'wb') as f:
+				f.write(data)
+
+			# Run the compiler on it
+			args = [arg.replace('{input}', in_file).replace('{output}', out_file) for arg in args]
+			process = subprocess.Popen(args,
+				stdout = subprocess.PIPE,
+				stderr = subprocess.PIPE,
+				cwd = temp_dir
+			)
+			stdout, stderr = process.communicate()
+
+			# Send back the output, and the object if it was built
+			data = b''
+			if process.returncode == 0 and os.path.isfile(out_file):
+				with open(out_file, 'rb') as f:
+					data = f.read()
+			header = {
+				'status' : 'ok',
+				'returncode' : process.returncode,
+				'sizes' : [len(stdout), len(stderr)]
+			}
+			return header, stdout + stderr + data
+		finally:
+			shutil.rmtree(temp_dir, True)
+
+class WorkerClient(object):
+	def __init__(self, hostname, port, timeout = 600.0, max_size = 256 * 1024 * 1024):
+		self.hostname = hostname
+		self.port = port
+		self.timeout = timeout
+		self.max_size = max_size
+
+	def get_slots(self):
+		header, data = self._request({'request' : 'info'})
+		return header['slots']
+
+	def compile(self, args, extension, data):
+		header, data = self._request({'request' : 'compile', 'args' : args, 'extension' : extension}, data)
+		if header.get('status') != 'ok':
+			raise IOError(header.get('message', 'Compile request failed'))
+
+		# Split the data into stdout, stderr, and the object
+		stdout_size, stderr_size = header['sizes']
+		stdout = data[0 : stdout_size]
+		stderr = data[stdout_size : stdout_size + stderr_size]
+		data = data[stdout_size + stderr_size : ]
+		return header['returncode'], stdout, stderr, data
+
+	def _request(self, header, data = b''):
+		sock = socket.create_connection((self.hostname, self.port), self.timeout)
+		try:
+			send_message(sock, header, data)
+			return recv_message(sock, self.max_size)
+		finally:
+			sock.close()
+
+if __name__ == '__main__':
+	if '-help' in sys.argv or '--help' in sys.argv:
+		print('Usage: build_worker.py [PORT] [SLOTS] [HOST]')
+		print('Listens on 127.0.0.1, unless another HOST is given, like 0.0.0.0.')
+		print('Anyone who can connect can run the compilers, so only listen on trusted networks.')
+		sys.exit(0)
+
+	logging.basicConfig(level=logging.INFO)
+	port = 9002
+	if len(sys.argv) > 1:
+		port = int(sys.argv[1])
+	slots = None
+	if len(sys.argv) > 2:
+		slots = int(sys.argv[2])
+	hostname = '127.0.0.1'
+	if len(sys.argv) > 3:
+		hostname = sys.argv[3]
+	server = WorkerServer(hostname, port, slots)
+	try:
+		logging.info('Listening')
+		server.start()
+	except:
+		logging.exception('Unexpected exception')
+	finally:
+		logging.info('Shutting down')
+	logging.info('All done')
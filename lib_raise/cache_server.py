@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2013-2014, Matthew Brennan Jones <matthew.brennan.jones@gmail.com>
+# Py-findlib is for finding libraries and programs on most operating systems
+# It uses a MIT style license
+# It is hosted at: https://github.com/workhorsy/py-findlib
+# 
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os, sys
+import re
+import json
+import hmac
+import socket
+import tempfile
+import threading
+import logging
+
+
+# Each message is a line of JSON, followed by 'size' bytes of data
+def send_message(sock, header, data = b''):
+	header = dict(header)
+	header['size'] = len(data)
+	sock.sendall(json.dumps(header).encode('utf-8') + b'\n' + data)
+
+def recv_message(sock, max_size):
+	# Read the header line
+	raw_header = b''
+	while not raw_header.endswith(b'\n'):
+		chunk = sock.recv(1)
+		if chunk == b'':
+			raise IOError('Socket closed remotely')
+		raw_header += chunk
+		if len(raw_header) > 4096:
+			raise IOError('Message header is too long')
+	header = json.loads(raw_header.decode('utf-8'))
+
+	# Read the data after it
+	size = header.get('size', 0)
+	if size > max_size:
+		raise IOError('Message data is too long')
+	chunks = []
+	while size > 0:
+		chunk = sock.recv(min(size, 65536))
+		if chunk == b'':
+			raise IOError('Socket closed remotely')
+		chunks.append(chunk)
+		size -= len(chunk)
+
+	return header, b''.join(chunks)
+
+def _is_same_token(a, b):
+	# Compare in the same time, no matter where they differ
+	if hasattr(hmac, 'compare_digest'):
+		return hmac.compare_digest(a.encode('utf-8'), b.encode('utf-8'))
+	return a == b
+
+# Anyone who can connect can read from the cache. But only clients with the
+# token can write to it, so others can't put bad outputs in it. Without a
+# token, the cache can only be read.
+class CacheServer(object):
+	def __init__(self, hostname, port, cache_dir, max_size = 256 * 1024 * 1024, token = None):
+		self.logger = logging.getLogger('cache_server')
+		self.hostname = hostname
+		self.port = port
+		self.cache_dir = cache_dir
+		self.max_size = max_size
+		self.token = token
+
+	def start(self):
+		self.listen()
+		self.serve()
+
+	def listen(self):
+		self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.socket.bind((self.hostname, self.port))
+		self.socket.listen(16)
+
+		# Get the real port, if it was picked by the OS
+		self.port = self.socket.getsockname()[1]
+		self.logger.debug('Listening on port %r', self.port)
+
+	def serve(self):
+		while True:
+			conn, address = self.socket.accept()
+			t = threading.Thread(target=self.on_client_connect, args=(conn, address))
+			t.daemon = True
+			t.start()
+
+	def on_client_connect(self, conn, address):
+		try:
+			conn.settimeout(60)
+			header, data = recv_message(conn, self.max_size)
+			request = header.get('request')
+			key = header.get('key', '')
+
+			# Only allow keys that are safe to use as file names
+			if not re.match(r'^[a-z]+-[0-9a-f]{40}$', key):
+				send_message(conn, {'status' : 'fail', 'message' : 'Invalid key'})
+			elif request == 'get':
+				data = self._read(key)
+				if data is None:
+					send_message(conn, {'status' : 'missing'})
+				else:
+					send_message(conn, {'status' : 'ok'}, data)
+			elif request == 'put':
+				token = header.get('token')
+				if not self.token or not token or not _is_same_token(token, self.token):
+					send_message(conn, {'status' : 'fail', 'message' : 'Invalid token'})
+				else:
+					self._write(key, data)
+					send_message(conn, {'status' : 'ok'})
+			else:
+				send_message(conn, {'status' : 'fail', 'message' : 'Unknown request: {0}'.format(request)})
+		except Exception:
+			self.logger.exception('Problem handling request from %r', address)
+		finally:
+			conn.close()
+
+	def _get_file(self, key):
+		return os.path.join(self.cache_dir, key[-40 : -38], key)
+
+	def _read(self, key):
+		try:
+			with open(self._get_file(key), 'rb') as f:
+				return f.read()
+		except (IOError, OSError):
+			return None
+
+	def _write(self, key, data):
+		# Write to a temp file, then move it into place
+		file_name = self._get_file(key)
+		dir_name = os.path.dirname(file_name)
+		if not os.path.isdir(dir_name):
+			try:
+				os.makedirs(dir_name)
+			except OSError:
+				pass
+		fd, temp_file = tempfile.mkstemp(dir=dir_name)
+		with os.fdopen(fd, 'wb') as f:
+			f.write(data)
+		if os.name == 'nt' and os.path.isfile(file_name):
+			os.remove(file_name)
+		os.rename(temp_file, file_name)
+
+class CacheClient(object):
+	def __init__(self, hostname, port, timeout = 5.0, max_size = 256 * 1024 * 1024, token = None):
+		self.hostname = hostname
+		self.port = port
+		self.timeout = timeout
+		self.max_size = max_size
+		self.token = token
+
+	def get(self, key):
+		header, data = self._request({'request' : 'get', 'key' : key})
+		if header.get('status') != 'ok':
+			return None
+		return data
+
+	def put(self, key, data):
+		header, data = self._request({'request' : 'put', 'key' : key, 'token' : self.token}, data)
+		return header.get('status') == 'ok'
+
+	def _request(self, header, data = b''):
+		sock = socket.create_connection((self.hostname, self.port), self.timeout)
+		try:
+			send_message(sock, header, data)
+			return recv_message(sock, self.max_size)
+		finally:
+			sock.close()
+
+if __name__ == '__main__':
+	if len(sys.argv) < 2:
+		print('Usage: cache_server.py CACHE_DIR [PORT] [HOST]')
+		print('Listens on localhost, unless another HOST is given, like 0.0.0.0.')
+		print('Clients need the token in RAISE_CACHE_TOKEN to write to the cache.')
+		sys.exit(1)
+
+	logging.basicConfig(level=logging.INFO)
+	port = 9001
+	if len(sys.argv) > 2:
+		port = int(sys.argv[2])
+	hostname = 'localhost'
+	if len(sys.argv) > 3:
+		hostname = sys.argv[3]
+	token = os.environ.get('RAISE_CACHE_TOKEN')
+	if not token:
+		logging.warning('No RAISE_CACHE_TOKEN set, so the cache can only be read')
+	server = CacheServer(hostname, port, os.path.abspath(sys.argv[1]), token=token)
+	try:
+		logging.info('Listening')
+		server.start()
+	except:
+		logging.exception('Unexpected exception')
+	finally:
+		logging.info('Shutting down')
+	logging.info('All done')
@@ -29,9 +29,16 @@
 
 import sys, os, re
 import ast
+import codecs
+import errno
 import platform
+import select
+import shlex
+import signal
 import subprocess
-from collections import namedtuple
+import tempfile
+import time
+from collections import namedtuple, deque
 
 import findlib_server
 
@@ -102,9 +109,222 @@ def _warn_symbol():
 def _fail_symbol():
 	return 'fail'
 
+# Characters that need a shell to run the command
+_shell_chars = set('|&;<>()$`\\*?[]{}~#!\n')
+
+# File descriptors that the programs that are run can use
+inherited_fds = []
+
+# The environment with all the variables expanded, and what it was made from
+_env = None
+_env_source = None
+
+def _get_env():
+	global _env, _env_source
+
+	# Recursively expand all environmental variables. Only when they change
+	source = dict(os.environ)
+	if source != _env_source:
+		_env = {}
+		for key, value in source.items():
+			_env[key] = expand_envs(value)
+		_env_source = source
+
+	return _env
+
+def _split_command(command):
+	# Commands on Windows are always run by the shell
+	if is_windows:
+		return None
+
+	# Commands that use the shell can't be split
+	if _shell_chars.intersection(command):
+		return None
+
+	try:
+		args = shlex.split(command)
+	except ValueError:
+		return None
+
+	# Commands that start by setting variables need the shell too
+	if not args or '=' in args[0]:
+		return None
+
+	return args
+
+# The processes that were started in their own process group, by pid. So
+# they, and any programs they start, can be stopped at once
+process_groups = {}
+
+def start_process(command, is_grouped = False, cpus = None):
+	'''
+	Starts the command with its stdout and stderr piped. Commands that
+	do not need a shell are run directly, which saves starting one. The
+	command can be a string, or a list of the program and its arguments.
+	If is_grouped, it is started in its own process group, which can be
+	stopped with kill_process_groups. If cpus are given, it only runs on
+	them. That is set before it starts, so anything it starts does too.
+	'''
+	if isinstance(command, (list, tuple)):
+		args = list(command)
+		command = str.join(' ', args)
+	else:
+		args = _split_command(command)
+
+	env = _get_env()
+
+	# Python 3 closes all the other file descriptors, unless told which to keep
+	options = {}
+	if inherited_fds and not PY2:
+		options['pass_fds'] = tuple(inherited_fds)
+
+	# Put it in a new session, which is also a new process group
+	use_setsid = is_grouped and not is_windows and PY2
+	if is_grouped and not is_windows and not PY2:
+		options['start_new_session'] = True
+
+	# Set the cpus it runs on in the child, before the program starts.
+	# Running code in the child is slower, so it is only done when needed
+	use_affinity = cpus and hasattr(os, 'sched_setaffinity')
+	if use_setsid or use_affinity:
+		def preexec():
+			if use_setsid:
+				os.setsid()
+			if use_affinity:
+				os.sched_setaffinity(0, cpus)
+		options['preexec_fn'] = preexec
+
+	# Start the program directly if we can
+	process = None
+	if args:
+		try:
+			process = subprocess.Popen(
+				args, 
+				stderr = subprocess.PIPE, 
+				stdout = subprocess.PIPE, 
+				shell = False, 
+				env = env, 
+				**options
+			)
+		# Not a program. It might be a shell command
+		except OSError as e:
+			if e.errno not in (errno.ENOENT, errno.EACCES, errno.ENOEXEC):
+				raise
+
+	if not process:
+		process = subprocess.Popen(
+			command, 
+			stderr = subprocess.PIPE, 
+			stdout = subprocess.PIPE, 
+			shell = True, 
+			env = env, 
+			**options
+		)
+
+	if is_grouped:
+		process_groups[process.pid] = process
+	return process
+
+def _signal_groups(processes, sig):
+	for process in processes:
+		try:
+			if hasattr(os, 'killpg'):
+				os.killpg(process.pid, sig)
+			else:
+				process.terminate()
+		except OSError:
+			pass
+
+def kill_process_groups(timeout = 1.0):
+	'''
+	Stops all the processes that were started in their own process group,
+	and the programs they started. They are asked to exit first, so they
+	can clean up. Then any still running after the timeout are killed.
+	'''
+	processes = list(process_groups.values())
+	process_groups.clear()
+	_signal_groups(processes, signal.SIGTERM)
+
+	deadline = time.time() + timeout
+	running = processes
+	while running and time.time() < deadline:
+		time.sleep(0.01)
+		running = [process for process in running if process.poll() == None]
+
+	_signal_groups(running, getattr(signal, 'SIGKILL', signal.SIGTERM))
+	for process in running:
+		try:
+			process.wait()
+		except OSError:
+			pass
+
+# The most characters of stdout or stderr to keep in memory for each process
+max_output_size = 4 * 1024 * 1024
+
+class OutputBuffer(object):
+	'''
+	Keeps the end of a process's output, decoded as it arrives. If there is
+	more than max_size characters, the oldest ones are dropped. The full
+	output is then saved to a log file, which is named in the output.
+	'''
+	def __init__(self, max_size = None):
+		self._decoder = codecs.getincrementaldecoder('UTF-8')('replace')
+		self._chunks = deque()
+		self._size = 0
+		self._max_size = max_size
+		self._log = None
+		self.log_name = None
+
+	def write(self, data):
+		text = self._decoder.decode(data)
+		if not text:
+			return
+
+		self._chunks.append(text)
+		self._size += len(text)
+
+		# The log is written after decoding. So the bytes of partial
+		# characters the decoder is holding go in with the rest of them
+		if self._log:
+			self._log.write(text.encode('UTF-8'))
+		elif self._max_size != None and self._size > self._max_size:
+			# Start the log with everything that was kept so far
+			fd, self.log_name = tempfile.mkstemp(prefix='raise-output-', suffix='.log')
+			self._log = os.fdopen(fd, 'wb')
+			self._log.write(str.join('', self._chunks).encode('UTF-8'))
+
+		if self._max_size == None or self._size <= self._max_size:
+			return
+
+		# Drop the oldest output
+		while self._size - len(self._chunks[0]) >= self._max_size:
+			self._size -= len(self._chunks.popleft())
+		extra = self._size - self._max_size
+		if extra > 0:
+			self._chunks[0] = self._chunks[0][extra : ]
+			self._size -= extra
+
+	def getvalue(self):
+		# Get any partial characters left at the end
+		text = self._decoder.decode(b'', True)
+		self._chunks.append(text)
+		value = str.join('', self._chunks)
+
+		# Close the log, and say where the rest of the output is
+		if self._log:
+			self._log.write(text.encode('UTF-8'))
+			self._log.close()
+			self._log = None
+		if self.log_name:
+			value = "(Output was cut. The full output is in '{0}')\n".format(self.log_name) + value
+
+		self._chunks = deque()
+		self._size = 0
+		return value
+
 class ProcessRunner(object):
-	def __init__(self, command):
-		if is_windows:
+	def __init__(self, command, is_output_limited = True, is_grouped = False, cpus = None):
+		if is_windows and not isinstance(command, (list, tuple)):
 			# Remove starting ./
 			if command.startswith('./'):
 				command = command[2 :]
@@ -112,51 +332,92 @@ class ProcessRunner(object):
 			command = command.replace('${', '%').replace('}', '%')
 
 		self._command = command
+		self._max_output_size = max_output_size if is_output_limited else None
+		self._is_grouped = is_grouped
+		self._cpus = cpus
 		self._process = None
+		self._max_rss = None
 		self._return_code = None
 		self._stdout = None
 		self._stderr = None
 		self._status = None
 
 	def run(self):
-		# Recursively expand all environmental variables
-		env = {}
-		for key, value in os.environ.items():
-			env[key] = expand_envs(value)
-
-		self._stdout = []
-		self._stderr = []
+		self._stdout = OutputBuffer(self._max_output_size)
+		self._stderr = OutputBuffer(self._max_output_size)
 
 		# Start the process and save the output
-		self._process = subprocess.Popen(
-			self._command, 
-			stderr = subprocess.PIPE, 
-			stdout = subprocess.PIPE, 
-			shell = True, 
-			env = env
-		)
+		self._process = start_process(self._command, self._is_grouped, self._cpus)
+
+		# Save the pipes that still have output to read
+		self._pipes = {
+			self._process.stdout.fileno() : (self._process.stdout, self._stdout),
+			self._process.stderr.fileno() : (self._process.stderr, self._stderr)
+		}
+
+	def get_fds(self):
+		return list(self._pipes.keys())
+	fds = property(get_fds)
+
+	def read_fd(self, fd):
+		# Read the next chunk of output. Or stop reading the pipe if it is empty
+		pipe, output = self._pipes[fd]
+		chunk = os.read(fd, 65536)
+		if chunk:
+			output.write(chunk)
+		else:
+			pipe.close()
+			del self._pipes[fd]
+
+	def _reap(self):
+		process_groups.pop(self._process.pid, None)
+		if self._process.returncode != None:
+			return
+
+		# Use wait4 if we can, to also get the most memory the process used
+		if hasattr(os, 'wait4'):
+			try:
+				pid, status, usage = _retry_on_eintr(os.wait4, self._process.pid, 0)
+			except OSError:
+				pass
+			else:
+				if os.WIFSIGNALED(status):
+					self._process.returncode = -os.WTERMSIG(status)
+				else:
+					self._process.returncode = os.WEXITSTATUS(status)
+
+				# OS X gives bytes, and everything else gives kilobytes
+				self._max_rss = usage.ru_maxrss
+				if not is_osx:
+					self._max_rss *= 1024
+
+		self._process.wait()
 
 	def wait(self):
 		# Wait for the process to actually exit
-		self._process.wait()
+		self._reap()
 
 		# Get the return code
 		rc = self._process.returncode
 		if hasattr(os, 'WIFEXITED') and os.WIFEXITED(rc):
 			rc = os.WEXITSTATUS(rc)
-		self._return_code = rc
 
-		# Get strerr and stdout into byte strings
-		self._stderr = b''.join(self._stderr)
-		self._stdout = b''.join(self._stdout)
+		# Get strerr and stdout, which are already decoded
+		self._set_output(rc, self._stdout.getvalue(), self._stderr.getvalue())
 
-		# Convert strerr and stdout into unicode
-		if PY2:
-			self._stderr = unicode(self._stderr, 'UTF-8')
-			self._stdout = unicode(self._stdout, 'UTF-8')
-		else:
-			self._stderr = str(self._stderr, 'UTF-8')
-			self._stdout = str(self._stdout, 'UTF-8')
+	def _set_output(self, rc, stdout, stderr):
+		self._return_code = rc
+		self._stderr = stderr
+		self._stdout = stdout
+
+		# Convert strerr and stdout into unicode, if they are not already
+		if isinstance(self._stdout, bytes):
+			if PY2:
+				self._stderr = unicode(self._stderr, 'UTF-8')
+				self._stdout = unicode(self._stdout, 'UTF-8')
+			else:
+				self._stderr = str(self._stderr, 'UTF-8')
+				self._stdout = str(self._stdout, 'UTF-8')
 
 		# Chomp the terminating newline off the ends of output
 		self._stdout = chomp(self._stdout)
@@ -174,14 +435,9 @@ class ProcessRunner(object):
 				self._status = _ok_symbol()
 
 	def get_is_done(self):
-		# You have to poll a process to update the retval. Even if it has stopped already
+		# Read the output until the process exits
 		if self._process.returncode == None:
-			self._process.poll()
-
-		# Read the output from the buffer
-		sout, serr = self._process.communicate()
-		self._stdout.append(sout)
-		self._stderr.append(serr)
+			wait_for_any([self])
 
 		# Return true if there is a return code
 		return self._process.returncode != None
@@ -202,6 +458,23 @@ class ProcessRunner(object):
 		return self._status == _fail_symbol()
 	is_failure = property(get_is_failure)
 
+	def get_is_killed(self):
+		# Killed by SIGKILL, like the Linux OOM killer does. Either directly,
+		# or in a shell that returns 128 plus the signal
+		self._require_wait()
+		return self._return_code in (-9, 128 + 9)
+	is_killed = property(get_is_killed)
+
+	def get_pid(self):
+		return self._process.pid
+	pid = property(get_pid)
+
+	def get_max_rss(self):
+		# The most bytes of memory the process used, or None if unknown
+		self._require_wait()
+		return self._max_rss
+	max_rss = property(get_max_rss)
+
 	def get_stderr(self):
 		self._require_wait()
 		return self._stderr
@@ -221,6 +494,80 @@ class ProcessRunner(object):
 		if self._return_code == None:
 			raise Exception("Wait needs to be called before any info on the process can be gotten.")
 
+def wait_for_any(runners, timeout = None):
+	'''
+	Waits until at least one of the runners has exited, and returns the
+	ones that have. Returns an empty list if the timeout runs out first.
+	The output of every runner is read as it arrives, so none of them
+	can get stuck on a full pipe.
+	'''
+	done = [runner for runner in runners if not runner._pipes]
+
+	# Windows can't wait on pipes, so just wait on the first runner
+	if is_windows and not done:
+		runner = runners[0]
+		sout, serr = runner._process.communicate()
+		runner._stdout.write(sout)
+		runner._stderr.write(serr)
+		runner._pipes = {}
+		done.append(runner)
+
+	# Get the runner for each pipe
+	fd_runners = {}
+	for runner in runners:
+		for fd in runner._pipes:
+			fd_runners[fd] = runner
+
+	# Read the pipes as they get output, until one of the runners has closed them all
+	deadline = None
+	if timeout != None:
+		deadline = time.time() + timeout
+	while not done:
+		wait = None
+		if deadline != None:
+			wait = max(deadline - time.time(), 0)
+
+		ready_fds = _wait_for_fds(list(fd_runners.keys()), wait)
+		for fd in ready_fds:
+			runner = fd_runners[fd]
+			runner.read_fd(fd)
+			if not fd in runner._pipes:
+				del fd_runners[fd]
+			if not runner._pipes:
+				done.append(runner)
+
+		# Stop if out of time
+		if not ready_fds and deadline != None and time.time() >= deadline:
+			break
+
+	# Reap the processes that are done
+	for runner in done:
+		runner._reap()
+
+	return done
+
+def _wait_for_fds(fds, timeout):
+	# Use poll if we have it, as select is limited in the number of fds
+	if hasattr(select, 'poll'):
+		poller = select.poll()
+		for fd in fds:
+			poller.register(fd, select.POLLIN | select.POLLHUP | select.POLLERR)
+
+		if timeout != None:
+			timeout = timeout * 1000
+		return [fd for fd, event in _retry_on_eintr(poller.poll, timeout)]
+	else:
+		return _retry_on_eintr(select.select, fds, [], [], timeout)[0]
+
+def _retry_on_eintr(cb, *args):
+	# Python 2 does not retry system calls that are interrupted by signals
+	while True:
+		try:
+			return cb(*args)
+		except (select.error, OSError, IOError) as e:
+			if e.args[0] != errno.EINTR:
+				raise
+
 def run_print(command):
 	_on_status("Running command")
 
@@ -240,7 +587,8 @@ def run_print(command):
 		_on_exit('Failed to run command.')
 
 def run_and_get_stdout(command):
-	runner = ProcessRunner(command)
+	# Keep all the output, as it is used and not just shown
+	runner = ProcessRunner(command, False)
 	runner.run()
 	runner.is_done
 	runner.wait()
@@ -27,6 +27,7 @@
 
 import os, sys
 import signal
+import time
 
 
 # Make sure we are in at least python 2.6
@@ -43,6 +44,21 @@ import lib_raise_terminal as Print
 import lib_raise_fs as FS
 import lib_raise_process as Process
 import lib_raise_find as Find
+import lib_raise_trace as Trace
+import findlib
+
+
+def _get_count_option(name, value):
+	# Make sure the option is a whole number of at least 1
+	if value is None:
+		return None
+	try:
+		count = int(value)
+	except ValueError:
+		count = 0
+	if count < 1:
+		Print.exit("The option '{0}' must be a number of 1 or more, not '{1}'.".format(name, value))
+	return count
 
 
 if __name__ == '__main__':
@@ -53,15 +69,33 @@ if __name__ == '__main__':
 			if arg == '-plain': Config.is_plain = True
 			elif arg == '-inspect': Config.is_inspect = True
 			elif arg == '-nolineno' : Config.is_nolineno = True
+			elif arg == '-concurrent' : Config.is_concurrent = True
+			elif arg == '-k' : Config.is_keep_going = True
+			elif arg.startswith('-cache=') : Config.cache_dir = os.path.abspath(arg.split('-cache=')[1])
+			elif arg.startswith('-remote_cache=') : Config.remote_cache = arg.split('-remote_cache=')[1]
+			elif arg.startswith('-workers=') : Config.workers = arg.split('-workers=')[1]
+			elif arg.startswith('-j=') : Config.jobs = arg.split('-j=')[1]
+			elif arg.startswith('-jmin=') : Config.jobs_min = arg.split('-jmin=')[1]
+			elif arg.startswith('-jobserver=') : Config.jobserver = arg.split('-jobserver=')[1]
+			elif arg == '-slot_server' : Config.slot_server = True
+			elif arg == '-pin' : Config.is_pin = True
+			elif arg.startswith('-trace=') : Config.trace_file = os.path.abspath(arg.split('-trace=')[1])
 			elif arg.startswith('-arg=') : Config.arg = arg.split('-arg=')[1]
 		else:
 			args.append(arg)
 
-	# Have all KeyboardInterrupt exceptions quit with a clean message
-	def signal_handler(signal, frame):
-		Print.exit('Exit called by the keyboard.')
+	# Have all KeyboardInterrupt exceptions quit with a clean message. The jobs
+	# run in their own sessions, so they don't get the signal. Stop them first
+	def signal_handler(signal_number, frame):
+		findlib.kill_process_groups()
+		if signal_number == signal.SIGINT:
+			Print.exit('Exit called by the keyboard.')
+		else:
+			Print.exit('Exit called by signal {0}.'.format(signal_number))
 		sys.exit(1)
-	signal.signal(signal.SIGINT, signal_handler)
+	for name in ['SIGINT', 'SIGTERM', 'SIGHUP']:
+		if hasattr(signal, name):
+			signal.signal(getattr(signal, name), signal_handler)
 
 	# Set the terminal to plain or fancy
 	if Config.is_plain:
@@ -69,6 +103,13 @@ if __name__ == '__main__':
 	else:
 		Print.set_fancy()
 
+	# Make sure the job counts are valid
+	Config.jobs = _get_count_option('-j', Config.jobs)
+	Config.jobs_min = _get_count_option('-jmin', Config.jobs_min)
+	Config.jobserver = _get_count_option('-jobserver', Config.jobserver)
+	if Config.jobs and Config.jobs_min and Config.jobs_min > Config.jobs:
+		Print.exit("The option '-jmin' can't be more than '-j'.")
+
 	# Clear the terminal if desired
 	if Print.clear:
 		os.system(Print.clear)
@@ -77,7 +118,9 @@ if __name__ == '__main__':
 	Config.target_name = str(str.join(' ', args))
 
 	# Load the rscript
+	start = time.time()
 	targets = Config.import_rscript(globals(), locals())
+	Trace.add_phase('Loading the rscript', 'raise', start)
 
 	# Get a friendly list of all the targets
 	target_list = []
@@ -123,4 +166,18 @@ if __name__ == '__main__':
 	# Try running the target in the rscript
 	target = targets[Config.target_name]
 	Print.info("Running target '{0}'".format(Config.target_name))
+
+	# Have all the events in the target be one build graph if desired
+	if Config.is_concurrent:
+		Process.concurrent_start()
+
+	start = time.time()
 	target()
+
+	# Run any events that are still waiting on the build graph
+	Process.wait_for_events()
+	Trace.add_phase("Running target '{0}'".format(Config.target_name), 'raise', start)
+
+	# Show how many jobs were run at once, if the number was limited or changed
+	if Config.jobs or Config.jobs_min or CPU.is_jobs_limit_changed():
+		Print.info("Most jobs run at once: {0}. Settled on: {1}.".format(CPU.get_jobs_peak(), CPU.get_jobs_limit()))
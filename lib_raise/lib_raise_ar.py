@@ -29,6 +29,7 @@ from osinfo import *
 import lib_raise_config as Config
 import lib_raise_users as Users
 import lib_raise_fs as FS
+import lib_raise_db as DB
 import lib_raise_process as Process
 import lib_raise_helpers as Helpers
 
@@ -61,10 +62,7 @@ def to_native(command):
 			'.a' : '.a'
 		}
 
-	for before, after in extension_map.items():
-		command = command.replace(before, after)
-
-	return command
+	return Helpers.replace_extensions(command, extension_map)
 
 def build_static_library(ar_file, o_files):
 	# Make sure the extension is valid
@@ -81,11 +79,13 @@ def build_static_library(ar_file, o_files):
 			str.join(' ', o_files)
 	command = to_native(command)
 
+	# Get the files the event reads and writes
+	to_update = [to_native(ar_file)]
+	triggers = [to_native(t) for t in o_files]
+
 	def setup():
 		# Skip if the files have not changed since last build
-		to_update = [to_native(ar_file)]
-		triggers = [to_native(t) for t in o_files]
-		if not FS.is_outdated(to_update, triggers):
+		if not DB.is_outdated(to_update, triggers, command):
 			return False
 
 		# Create the output directory if it does not exist
@@ -94,7 +94,7 @@ def build_static_library(ar_file, o_files):
 		return True
 
 	# Create the event
-	event = Process.Event(task, result, plural, singular, command, setup)
+	event = Process.Event(task, result, plural, singular, command, setup, triggers, to_update, cache=True)
 	Process.add_event(event)
 
 
@@ -34,7 +34,10 @@ import lib_raise_users as Users
 import lib_raise_find as Find
 import lib_raise_process as Process
 import lib_raise_fs as FS
+import lib_raise_db as DB
+import lib_raise_distribute as Distribute
 import lib_raise_helpers as Helpers
+import lib_raise_trace as Trace
 
 from osinfo import *
 import findlib
@@ -117,7 +120,12 @@ def setup():
 				optimize_three =       '-O3',
 				optimize_size =        '-Os',
 				compile_time_flags =   '-D',
-				link =                 '-shared -Wl,-as-needed'
+				link =                 '-shared -Wl,-as-needed',
+				dependencies =         '-MMD -MF ',
+				dependencies_style =   'gcc',
+				preprocess =           '-E',
+				precompiled_header_extension = '.gch',
+				precompiled_header_style = 'gcc'
 			)
 			c_compilers[comp._name] = comp
 		elif name == 'clang':
@@ -139,7 +147,12 @@ def setup():
 				optimize_three =       '-O3',
 				optimize_size =        '-Os',
 				compile_time_flags =   '-D',
-				link =                 '-shared'
+				link =                 '-shared',
+				dependencies =         '-MMD -MF ',
+				dependencies_style =   'gcc',
+				preprocess =           '-E',
+				precompiled_header_extension = '.pch',
+				precompiled_header_style = 'gcc'
 			)
 			c_compilers[comp._name] = comp
 		elif name == 'cl.exe':
@@ -162,7 +175,12 @@ def setup():
 				optimize_three =       '/Ox',
 				optimize_size =        '/Os',
 				compile_time_flags =   '/D',
-				link =                 '/LDd'
+				link =                 '/LDd',
+				dependencies =         '/showIncludes',
+				dependencies_style =   'msvc',
+				preprocess =           None,
+				precompiled_header_extension = '.pch',
+				precompiled_header_style = 'msvc'
 			)
 			c_compilers[comp._name] = comp
 
@@ -181,7 +199,9 @@ class CCompiler(object):
 				warnings_all, warnings_extra, warnings_as_errors,
 				optimize_zero, optimize_one, optimize_two,
 				optimize_three, optimize_size,
-				compile_time_flags, link):
+				compile_time_flags, link,
+				dependencies, dependencies_style, preprocess,
+				precompiled_header_extension, precompiled_header_style):
 
 		self._name = name
 		self._path = path
@@ -204,6 +224,11 @@ class CCompiler(object):
 
 		self._opt_compile_time_flags = compile_time_flags
 		self._opt_link = link
+		self._opt_dependencies = dependencies
+		self._opt_dependencies_style = dependencies_style
+		self._opt_preprocess = preprocess
+		self._opt_precompiled_header_extension = precompiled_header_extension
+		self._opt_precompiled_header_style = precompiled_header_style
 
 		# Set the default values of the flags
 		self.debug = False
@@ -214,6 +239,12 @@ class CCompiler(object):
 		self.warnings_as_errors = False
 		self.optimize_level = 1
 		self.compile_time_flags = []
+		self.unity_batch_size = 8
+		self.precompiled_header = None
+
+		# The scheduler pools that objects and links are run in
+		self.compile_pool = None
+		self.link_pool = 'link'
 
 	def get_cc(self):
 		return self._name
@@ -272,11 +303,13 @@ class CCompiler(object):
 					out_file)
 		command = to_native(command)
 
+		# Get the files the event reads and writes
+		to_update = [to_native(out_file)]
+		triggers = [to_native(t) for t in obj_files + i_files]
+
 		def setup():
 			# Skip if the files have not changed since last build
-			to_update = [to_native(out_file)]
-			triggers = [to_native(t) for t in obj_files + i_files]
-			if not FS.is_outdated(to_update, triggers):
+			if not DB.is_outdated(to_update, triggers, command):
 				return False
 
 			# Create the output directory if it does not exist
@@ -285,7 +318,7 @@ class CCompiler(object):
 			return True
 
 		# Create the event
-		event = Process.Event(task, result, plural, singular, command, setup)
+		event = Process.Event(task, result, plural, singular, command, setup, triggers, to_update, pool=self.link_pool)
 		Process.add_event(event)
 
 	def build_object(self, o_file, c_files, i_files=[]):
@@ -305,13 +338,28 @@ class CCompiler(object):
 					o_file,
 					str.join(' ', c_files),
 					str.join(' ', i_files))
+
+		# Have the compiler tell us which headers the object uses
+		if self._opt_dependencies_style == 'gcc':
+			command += ' {0}{1}.d'.format(self._opt_dependencies, to_native(o_file))
+		elif self._opt_dependencies_style == 'msvc':
+			command += ' {0}'.format(self._opt_dependencies)
+
+		# Use the precompiled header if there is one
+		pch_flags = self._get_precompiled_header_flags()
+		command += pch_flags
 		command = to_native(command)
 
+		# Get the files the event reads and writes. Objects are rebuilt when
+		# the precompiled header is
+		to_update = [to_native(o_file)]
+		triggers = [to_native(t) for t in c_files + i_files]
+		if self.precompiled_header:
+			triggers.append(self._get_precompiled_header_file())
+
 		def setup():
 			# Skip if the files have not changed since last build
-			to_update = [to_native(o_file)]
-			triggers = [to_native(t) for t in c_files + i_files]
-			if not FS.is_outdated(to_update, triggers):
+			if not DB.is_outdated(to_update, triggers, command, True):
 				return False
 
 			# Create the output directory if it does not exist
@@ -319,10 +367,161 @@ class CCompiler(object):
 
 			return True
 
+		# Have a worker build the object if there are any. It is preprocessed
+		# here, so the worker does not need the headers
+		distribute = None
+		if Distribute.is_enabled() and self._opt_preprocess and len(c_files) == 1 and not i_files:
+			preprocessed_file = o_file + '.i'
+			preprocess_command = '"{0}" {1} {2} {3} {4}{5}'.format(
+						self._path,
+						self.cflags,
+						self._opt_preprocess,
+						c_files[0],
+						self._opt_out_file,
+						preprocessed_file) + pch_flags
+			if self._opt_dependencies_style == 'gcc':
+				preprocess_command += ' {0}{1}.d'.format(self._opt_dependencies, to_native(o_file))
+			args = [self._name] + self.cflags.split() + [self._opt_no_link, '{input}', self._opt_out_file.strip(), '{output}']
+			if Distribute.is_allowed(args):
+				distribute = Distribute.Job(to_native(preprocess_command), to_native(preprocessed_file), args, '.i', to_native(o_file))
+
+		# Let the object be built by the same process as others with the same flags
+		batch = self._get_batch(o_file, c_files, i_files, pch_flags)
+
 		# Create the event
-		event = Process.Event(task, result, plural, singular, command, setup)
+		event = Process.Event(task, result, plural, singular, command, setup, triggers, to_update, self._opt_dependencies_style, cache=True, distribute=distribute, batch=batch, pool=self.compile_pool)
 		Process.add_event(event)
 
+	def build_precompiled_header(self, h_file):
+		# Setup the messages
+		task = 'Building'
+		result = h_file
+		plural = 'C precompiled headers'
+		singular = 'C precompiled header'
+		pch_file = h_file + self._opt_precompiled_header_extension
+
+		# gcc and clang compile the header by itself
+		if self._opt_precompiled_header_style == 'gcc':
+			command = '"{0}" {1} -x c-header {2} {3}{4} {5}{6}.d'.format(
+						self._path,
+						self.cflags,
+						h_file,
+						self._opt_out_file,
+						pch_file,
+						self._opt_dependencies,
+						pch_file)
+			to_update = [pch_file]
+		# cl.exe compiles a source that includes the header
+		elif self._opt_precompiled_header_style == 'msvc':
+			c_file = h_file + '.c'
+			_write_if_changed(c_file, '#include "{0}"\n'.format(os.path.basename(h_file)))
+			command = '"{0}" {1} {2} /Yc{3} /Fp{4} /Fo{5}.obj {6} {7}'.format(
+						self._path,
+						self.cflags,
+						self._opt_no_link,
+						h_file,
+						pch_file,
+						h_file,
+						c_file,
+						self._opt_dependencies)
+			to_update = [pch_file, h_file + '.obj']
+		else:
+			Print.exit("The compiler '{0}' does not support precompiled headers.".format(self._name))
+		command = to_native(command)
+
+		# Get the files the event reads
+		triggers = [h_file]
+
+		def setup():
+			# Skip if the files have not changed since last build
+			if not DB.is_outdated(to_update, triggers, command, True):
+				return False
+
+			# Create the output directory if it does not exist
+			FS.create_path_dirs(pch_file)
+
+			return True
+
+		# Create the event
+		event = Process.Event(task, result, plural, singular, command, setup, triggers, to_update, self._opt_dependencies_style, pool=self.compile_pool)
+		Process.add_event(event)
+
+	def _get_precompiled_header_file(self):
+		return self.precompiled_header + self._opt_precompiled_header_extension
+
+	def _get_precompiled_header_flags(self):
+		if not self.precompiled_header:
+			return ''
+
+		# gcc and clang use the precompiled header when the header is included
+		if self._opt_precompiled_header_style == 'gcc':
+			return ' -include {0}'.format(self.precompiled_header)
+		# cl.exe needs to be told where the precompiled header is
+		elif self._opt_precompiled_header_style == 'msvc':
+			return ' /Yu{0} /Fp{1} /FI{0}'.format(self.precompiled_header, self._get_precompiled_header_file())
+
+		return ''
+
+	def _get_batch(self, o_file, c_files, i_files, pch_flags):
+		# Only objects named after their one source can be built together
+		if len(c_files) != 1 or i_files:
+			return None
+		stem = os.path.splitext(os.path.basename(c_files[0]))[0]
+		if os.path.basename(o_file) != stem + '.o':
+			return None
+
+		# gcc and clang put the objects and header lists in the current directory.
+		# The header list is removed after, so don't batch if the file is there
+		if self._opt_dependencies_style == 'gcc':
+			if os.path.dirname(o_file) or os.path.exists(stem + '.d'):
+				return None
+			command = '"{0}" {1} {2} {{sources}} -MMD'.format(
+						self._path,
+						self.cflags,
+						self._opt_no_link)
+			depfile = stem + '.d'
+		# cl.exe puts the objects in the directory given to /Fo
+		elif self._opt_dependencies_style == 'msvc':
+			out_dir = os.path.dirname(o_file)
+			command = '"{0}" {1} {2} {{sources}} {3}'.format(
+						self._path,
+						self.cflags,
+						self._opt_no_link,
+						self._opt_dependencies)
+			if out_dir:
+				command += ' /Fo{0}'.format(os.path.join(out_dir, ''))
+			depfile = None
+		else:
+			return None
+
+		return Process.Batch(to_native(command + pch_flags), to_native(c_files[0]), depfile)
+
+	def build_unity_objects(self, name, c_files, i_files=[]):
+		# Put the sources into groups, in the order they were given. So adding
+		# or changing one source only rebuilds its group
+		batch_size = max(self.unity_batch_size, 1)
+		groups = _get_unity_groups(name, c_files, batch_size, '.c')
+
+		o_files = []
+		for i, group in enumerate(groups):
+			unity_file = '{0}_unity{1}.c'.format(name, i)
+			o_file = '{0}_unity{1}.o'.format(name, i)
+
+			# Write a source that includes all the sources in the group
+			unity_dir = os.path.dirname(os.path.abspath(unity_file))
+			code = ''
+			for c_file in group:
+				path = os.path.relpath(os.path.abspath(c_file), unity_dir).replace(os.sep, '/')
+				code += '#include "{0}"\n'.format(path)
+			_write_if_changed(unity_file, code)
+
+			# Build it like any other object. The sources it includes are
+			# tracked like headers
+			self.build_object(o_file, [unity_file], i_files)
+			o_files.append(o_file)
+
+		return o_files
+
 	def build_program(self, o_file, c_files, i_files=[]):
 		# Make sure the extension is valid
 		Helpers.require_file_extension(o_file, '.exe')
@@ -341,11 +540,13 @@ class CCompiler(object):
 					o_file)
 		command = to_native(command)
 
+		# Get the files the event reads and writes
+		to_update = [to_native(o_file)]
+		triggers = [to_native(t) for t in c_files + i_files]
+
 		def setup():
 			# Skip if the files have not changed since last build
-			to_update = [to_native(o_file)]
-			triggers = [to_native(t) for t in c_files + i_files]
-			if not FS.is_outdated(to_update, triggers):
+			if not DB.is_outdated(to_update, triggers, command):
 				return False
 
 			# Create the output directory if it does not exist
@@ -354,7 +555,7 @@ class CCompiler(object):
 			return True
 
 		# Create the event
-		event = Process.Event(task, result, plural, singular, command, setup)
+		event = Process.Event(task, result, plural, singular, command, setup, triggers, to_update, pool=self.link_pool)
 		Process.add_event(event)
 
 	def build_shared_library(self, so_file, o_files):
@@ -375,11 +576,13 @@ class CCompiler(object):
 					so_file)
 		command = to_native(command)
 
+		# Get the files the event reads and writes
+		to_update = [to_native(so_file)]
+		triggers = [to_native(t) for t in o_files]
+
 		def setup():
 			# Skip if the files have not changed since last build
-			to_update = [to_native(so_file)]
-			triggers = [to_native(t) for t in o_files]
-			if not FS.is_outdated(to_update, triggers):
+			if not DB.is_outdated(to_update, triggers, command):
 				return False
 
 			# Create the output directory if it does not exist
@@ -388,10 +591,83 @@ class CCompiler(object):
 			return True
 
 		# Create the event
-		event = Process.Event(task, result, plural, singular, command, setup)
+		event = Process.Event(task, result, plural, singular, command, setup, triggers, to_update, pool=self.link_pool)
 		Process.add_event(event)
 
 
+def _get_unity_groups(name, c_files, batch_size, extension):
+	# Read the groups that were built last time, and how long each took
+	old_groups = []
+	while True:
+		unity_file = '{0}_unity{1}{2}'.format(name, len(old_groups), extension)
+		if not FS.is_file(unity_file):
+			break
+		unity_dir = os.path.dirname(os.path.abspath(unity_file))
+		with open(unity_file, 'r') as f:
+			paths = [line.split('"')[1] for line in f.read().splitlines() if line.startswith('#include "')]
+		paths = [os.path.normpath(os.path.join(unity_dir, path)) for path in paths]
+		o_file = '{0}_unity{1}.o'.format(name, len(old_groups))
+		old_groups.append((paths, DB.get_duration(o_file)))
+
+	# Keep the same groups if the sources are the same. Otherwise the groups
+	# would move a little each time, and rebuild everything
+	group_count = (len(c_files) + batch_size - 1) // batch_size
+	paths = [os.path.normpath(os.path.abspath(c_file)) for c_file in c_files]
+	if len(old_groups) == group_count and \
+		paths == [path for group, duration in old_groups for path in group]:
+		groups = []
+		start = 0
+		for group, duration in old_groups:
+			groups.append(c_files[start : start + len(group)])
+			start += len(group)
+		return groups
+
+	# Guess how long each source takes from its size. Use how long its group
+	# took last time to know how slow each byte is to build
+	sizes = {}
+	for path in paths:
+		st = FS.get_stat(path)
+		sizes[path] = 1
+		if st:
+			sizes[path] = max(st.st_size, 1)
+	rates = {}
+	for group, duration in old_groups:
+		size = sum([sizes.get(path, 0) for path in group])
+		if duration and size:
+			for path in group:
+				rates[path] = float(duration) / size
+	default_rate = 1.0
+	if rates:
+		default_rate = sum(rates.values()) / len(rates)
+	costs = [sizes[path] * rates.get(path, default_rate) for path in paths]
+
+	# Split them into groups that take about the same time to build, keeping
+	# the order they were given in
+	target = sum(costs) / max(group_count, 1)
+	groups = [[]]
+	cost = 0
+	for c_file, file_cost in zip(c_files, costs):
+		if groups[-1] and cost + file_cost / 2 > target and len(groups) < group_count:
+			groups.append([])
+			cost = 0
+		groups[-1].append(c_file)
+		cost += file_cost
+	if not groups[-1]:
+		groups.pop()
+	return groups
+
+def _write_if_changed(file_name, code):
+	# Leave the file alone if it is the same, so it is not rebuilt
+	if FS.is_file(file_name):
+		with open(file_name, 'r') as f:
+			if f.read() == code:
+				return
+
+	FS.create_path_dirs(file_name)
+	with open(file_name, 'w') as f:
+		f.write(code)
+	FS.forget_stats([file_name])
+
 def to_native(command):
 	extension_map = {}
 	# Figure out the extensions for this OS
@@ -424,10 +700,7 @@ def to_native(command):
 			'.a' : '.a'
 		}
 
-	for before, after in extension_map.items():
-		command = command.replace(before, after)
-
-	return command
+	return Helpers.replace_extensions(command, extension_map)
 
 def get_default_compiler():
 	global c_compilers
@@ -448,6 +721,7 @@ def get_default_compiler():
 	return None
 
 def run_print(command):
+	Process.wait_for_events()
 	Print.status("Running C program")
 
 	native_command = to_native(command)
@@ -455,6 +729,7 @@ def run_print(command):
 	runner.run()
 	runner.is_done
 	runner.wait()
+	FS.clear_stat_cache()
 
 	if runner.is_success or runner.is_warning:
 		Print.ok()
@@ -640,4 +915,4 @@ def uninstall_header(name, dir_name=None):
 					"Failed to uninstall the header '{0}'.".format(name),
 				lambda: fn())
 
-setup()
+Trace.call('Setting up C module', 'setup', setup)
@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# This file is part of Raise.
+# Raise is a small build automation tool that ships with your software.
+# Raise uses a MIT style license, and is hosted at https://github.com/workhorsy/raise .
+# Copyright (c) 2012-2017 Matthew Brennan Jones <matthew.brennan.jones@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+import json
+import time
+import hashlib
+import shutil
+import socket
+import tempfile
+import threading
+import atexit
+try:
+	import queue
+except ImportError as err:
+	import Queue as queue
+import lib_raise_config as Config
+import lib_raise_fs as FS
+import lib_raise_db as DB
+import cache_server
+
+
+# The most builds of one source to remember with different headers
+max_manifest_entries = 20
+
+# How long to wait for the remote cache, and how many requests to it to run
+# at once. It is not used for the rest of the run once it can't be reached
+remote_timeout = 5.0
+max_remote_threads = 4
+
+remote_client = None
+is_remote_down = False
+remote_queue = queue.Queue()
+remote_threads = []
+lookups = {}
+
+
+# The cache is a dir of built outputs. The outputs are found by a hash of the
+# command, and of the sources and headers they were built from. Since the
+# headers are only known after building, the sources point to a manifest of
+# the headers each earlier build used. The remote cache stores the same
+# manifests and outputs, on a cache_server shared by many machines. The remote
+# lookups are started in threads before the events run. A lookup that is not
+# done when its event runs counts as a miss, so the build never waits on the
+# network. Writing to the remote cache needs the token the
+# cache_server was started with, in RAISE_CACHE_TOKEN.
+def setup():
+	pass
+
+def get_cache_dir():
+	return Config.cache_dir or os.environ.get('RAISE_CACHE_DIR')
+
+def get_remote_cache():
+	return Config.remote_cache or os.environ.get('RAISE_REMOTE_CACHE')
+
+def get_cache_token():
+	return os.environ.get('RAISE_CACHE_TOKEN')
+
+def is_enabled():
+	return get_cache_dir() is not None or _is_remote_up()
+
+def is_remote_enabled():
+	return _is_remote_up()
+
+def _is_remote_up():
+	return get_remote_cache() is not None and not is_remote_down
+
+def _to_name(file_name):
+	# Use names relative to the current dir, so other checkouts get cache hits
+	key = os.path.abspath(file_name)
+	cwd = os.getcwd()
+	if key.startswith(cwd + os.sep):
+		return os.path.relpath(key, cwd)
+	return key
+
+def _get_hashes(file_names):
+	hashes = {}
+	for file_name in file_names:
+		hashes[_to_name(file_name)] = DB.get_hash(file_name)
+	return hashes
+
+def _hash_file(file_name):
+	# The same hash as DB.get_hash, but without the database. So it can be
+	# used in the remote threads
+	if not os.path.isfile(file_name):
+		return None
+
+	h = hashlib.sha1()
+	with open(file_name, 'rb') as f:
+		while True:
+			chunk = f.read(65536)
+			if not chunk:
+				break
+			h.update(chunk)
+	return h.hexdigest()
+
+def _hash_of(*things):
+	h = hashlib.sha1()
+	h.update(json.dumps(things, sort_keys=True).encode('utf-8'))
+	return h.hexdigest()
+
+def _get_manifest_file(key):
+	return os.path.join(get_cache_dir(), 'manifests', key[0 : 2], key + '.json')
+
+def _get_entry_dir(key):
+	return os.path.join(get_cache_dir(), key[0 : 2], key)
+
+def _get_source_key(command, triggers):
+	triggers = [t for t in FS.glob_names(triggers) if FS.is_file(t)]
+	return _hash_of(DB.get_signature(command), _get_hashes(triggers))
+
+def _get_matching_entries(manifest, get_hash = DB.get_hash):
+	# Get the earlier builds that used headers that have not changed
+	for entry in manifest:
+		hashes = {}
+		for dep in entry['deps']:
+			hashes[dep] = get_hash(dep)
+		if hashes == entry['deps']:
+			yield entry
+
+def _add_to_manifest(manifest, key, dep_hashes):
+	# Put this build first in the manifest
+	manifest = [entry for entry in manifest if entry['key'] != key]
+	manifest.insert(0, {'key' : key, 'deps' : dep_hashes})
+	return manifest[0 : max_manifest_entries]
+
+def _replace_file(temp_file, file_name):
+	if os.name == 'nt' and os.path.isfile(file_name):
+		os.remove(file_name)
+	os.rename(temp_file, file_name)
+
+def _read_manifest(key):
+	try:
+		with open(_get_manifest_file(key), 'r') as f:
+			return json.load(f)
+	except (IOError, OSError, ValueError):
+		return []
+
+def _write_manifest(key, manifest):
+	manifest_file = _get_manifest_file(key)
+	FS.create_path_dirs(manifest_file)
+
+	# Write to a temp file, then move it over the old one
+	fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(manifest_file))
+	with os.fdopen(fd, 'w') as f:
+		json.dump(manifest, f)
+	_replace_file(temp_file, manifest_file)
+
+def _get_local(source_key, to_update):
+	for entry in _get_matching_entries(_read_manifest(source_key)):
+		# Read what the compiler printed
+		entry_dir = _get_entry_dir(entry['key'])
+		try:
+			with open(os.path.join(entry_dir, 'result.json'), 'r') as f:
+				result = json.load(f)
+		except (IOError, OSError, ValueError):
+			continue
+
+		# Copy the outputs out of the cache
+		try:
+			for i, update in enumerate(to_update):
+				FS.create_path_dirs(update)
+				temp_file = update + '.raise_cache'
+				shutil.copyfile(os.path.join(entry_dir, str(i)), temp_file)
+				_replace_file(temp_file, update)
+		except (IOError, OSError):
+			continue
+
+		return result
+
+	return None
+
+def _put_local(source_key, key, dep_hashes, to_update, result):
+	try:
+		# Copy the outputs into a temp dir, then move it into the cache
+		entry_dir = _get_entry_dir(key)
+		if not os.path.isdir(entry_dir):
+			FS.create_path_dirs(entry_dir)
+			temp_dir = tempfile.mkdtemp(dir=os.path.dirname(entry_dir))
+			for i, update in enumerate(to_update):
+				shutil.copyfile(update, os.path.join(temp_dir, str(i)))
+			with open(os.path.join(temp_dir, 'result.json'), 'w') as f:
+				json.dump(result, f)
+
+			# Another build may have added the same outputs first
+			try:
+				os.rename(temp_dir, entry_dir)
+			except OSError:
+				shutil.rmtree(temp_dir, True)
+
+		manifest = _add_to_manifest(_read_manifest(source_key), key, dep_hashes)
+		_write_manifest(source_key, manifest)
+	except (IOError, OSError):
+		# The cache is only an optimization, so keep building
+		pass
+
+def _get_remote_client():
+	global remote_client
+
+	if not remote_client:
+		hostname, port = get_remote_cache().rsplit(':', 1)
+		remote_client = cache_server.CacheClient(hostname, int(port), remote_timeout, token=get_cache_token())
+	return remote_client
+
+def _remote_request(name, *args):
+	global is_remote_down
+
+	# Stop using the remote cache if it fails, and build locally
+	if not _is_remote_up():
+		return None
+
+	try:
+		return getattr(_get_remote_client(), name)(*args)
+	except (socket.error, IOError, OSError, ValueError):
+		is_remote_down = True
+		return None
+
+def _remote_thread():
+	while True:
+		cb = remote_queue.get()
+		try:
+			cb()
+		except Exception:
+			pass
+		finally:
+			remote_queue.task_done()
+
+def _run_remote(cb):
+	# Start the remote threads, and run the callback in one
+	while len(remote_threads) < max_remote_threads:
+		t = threading.Thread(target=_remote_thread)
+		t.daemon = True
+		t.start()
+		remote_threads.append(t)
+
+	remote_queue.put(cb)
+
+def _pack_outputs(to_update, result):
+	# Put the result and the sizes of the outputs on the first line
+	datas = []
+	for update in to_update:
+		with open(update, 'rb') as f:
+			datas.append(f.read())
+	header = dict(result)
+	header['sizes'] = [len(data) for data in datas]
+	return json.dumps(header).encode('utf-8') + b'\n' + b''.join(datas)
+
+def _unpack_outputs(packed, to_update):
+	header, packed = packed.split(b'\n', 1)
+	header = json.loads(header.decode('utf-8'))
+
+	# Write the outputs
+	for update, size in zip(to_update, header.pop('sizes')):
+		FS.create_path_dirs(update)
+		temp_file = update + '.raise_cache'
+		with open(temp_file, 'wb') as f:
+			f.write(packed[0 : size])
+		_replace_file(temp_file, update)
+		packed = packed[size : ]
+
+	return header
+
+class Lookup(object):
+	def __init__(self):
+		self.done = threading.Event()
+		self.entry = None
+		self.packed = None
+
+def _fetch_remote(source_key, lookup):
+	# Runs in a remote thread. Gets the first build with the same headers
+	try:
+		manifest = _remote_request('get', 'manifest-' + source_key)
+		if not manifest:
+			return
+
+		for entry in _get_matching_entries(json.loads(manifest.decode('utf-8')), _hash_file):
+			packed = _remote_request('get', 'entry-' + entry['key'])
+			if packed:
+				lookup.entry, lookup.packed = entry, packed
+				return
+	finally:
+		lookup.done.set()
+
+def _start_lookup(source_key):
+	lookup = Lookup()
+	lookups[source_key] = lookup
+	_run_remote(lambda: _fetch_remote(source_key, lookup))
+	return lookup
+
+def prefetch(command, triggers):
+	# Start looking for the outputs in the remote cache, before they are needed
+	if not _is_remote_up():
+		return
+
+	source_key = _get_source_key(command, triggers)
+	if not source_key in lookups:
+		_start_lookup(source_key)
+
+def _get_remote(source_key, to_update):
+	# Only use the lookup if it is already done. Waiting on the network would
+	# stop the other jobs from starting, so anything else is a miss
+	lookup = lookups.pop(source_key, None)
+	if not lookup or not lookup.done.is_set() or not lookup.packed:
+		return None
+
+	try:
+		result = _unpack_outputs(lookup.packed, to_update)
+	except (IOError, OSError, ValueError):
+		return None
+
+	# Also save it in the local cache
+	entry = lookup.entry
+	if get_cache_dir():
+		_put_local(source_key, entry['key'], entry['deps'], to_update, result)
+
+	return result
+
+def _upload(source_key, key, dep_hashes, packed):
+	# Upload the outputs, then add them to the manifest
+	if _remote_request('put', 'entry-' + key, packed):
+		manifest = _remote_request('get', 'manifest-' + source_key)
+		manifest = json.loads(manifest.decode('utf-8')) if manifest else []
+		manifest = _add_to_manifest(manifest, key, dep_hashes)
+		_remote_request('put', 'manifest-' + source_key, json.dumps(manifest).encode('utf-8'))
+
+def _put_remote(source_key, key, dep_hashes, to_update, result):
+	# The cache_server only takes uploads with its token
+	if not get_cache_token():
+		return
+
+	# Read the outputs now, in case they are changed before the upload
+	try:
+		packed = _pack_outputs(to_update, result)
+	except (IOError, OSError):
+		return
+
+	_run_remote(lambda: _upload(source_key, key, dep_hashes, packed))
+
+def get(command, triggers, to_update):
+	source_key = _get_source_key(command, triggers)
+
+	# Look in the local cache, then in the remote cache
+	result = None
+	if get_cache_dir():
+		result = _get_local(source_key, to_update)
+	if not result and _is_remote_up():
+		result = _get_remote(source_key, to_update)
+	if not result:
+		return None
+
+	FS.forget_stats(to_update)
+	return result['stdout'], result['stderr'], result['deps']
+
+def put(command, triggers, to_update, stdout, stderr, deps):
+	source_key = _get_source_key(command, triggers)
+	deps = [_to_name(dep) for dep in deps or []]
+	dep_hashes = _get_hashes(deps)
+	key = _hash_of(source_key, dep_hashes)
+	result = {'stdout' : stdout, 'stderr' : stderr, 'deps' : deps}
+
+	if get_cache_dir():
+		_put_local(source_key, key, dep_hashes, to_update, result)
+	if _is_remote_up():
+		_put_remote(source_key, key, dep_hashes, to_update, result)
+
+def wait_for_uploads():
+	# Give the uploads a little time to finish
+	timeout = time.time() + remote_timeout
+	while remote_queue.unfinished_tasks and time.time() < timeout:
+		time.sleep(0.05)
+
+def wait_for_lookups():
+	# Wait for the lookups that were started, so the events find them done
+	timeout = time.time() + remote_timeout * 3
+	for lookup in list(lookups.values()):
+		lookup.done.wait(max(timeout - time.time(), 0))
+
+def exit_module():
+	wait_for_uploads()
+
+
+setup()
+atexit.register(exit_module)
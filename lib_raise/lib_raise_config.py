@@ -37,6 +37,17 @@ python = sys.executable
 is_plain = False
 is_inspect = False
 is_nolineno = False
+is_concurrent = False
+is_keep_going = False
+cache_dir = None
+remote_cache = None
+workers = None
+jobs = None
+jobs_min = None
+jobserver = None
+slot_server = False
+is_pin = False
+trace_file = None
 arg = []
 
 
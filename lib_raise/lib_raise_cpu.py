@@ -26,8 +26,10 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import sys, os, re
+import math
 import subprocess
 import threading
+import time
 import atexit
 
 import lib_raise_helpers as Helpers
@@ -46,17 +48,401 @@ name = None
 vendor_name = None
 flags = []
 cpus_total = None
+cpus_available = None
 cpus_free = None
 cpu_utilization = 0.0
+cpu_iowait = 0.0
+load_average = None
+cpu_pressure = None
+memory_total = None
+memory_available = None
+memory_pressure = None
+memory_reserve = 0.05
+sample_interval = 0.1
 utilization_thread = None
 is_utilization_thread_running = False
 
+# How many jobs to run at once. Changed while building, to get the most
+# jobs done per second without overloading the machine
+jobs_min = 1
+jobs_max = None
+jobs_limit = None
+jobs_first_limit = None
+jobs_running = 0
+jobs_peak = 0
+control_interval = 1.0
+_window_start = None
+_window_done = 0
+_window_limit = None
+_last_throughput = None
+_last_limit = None
+
+# The cpus grouped by physical core, NUMA node, and shared cache. Read the
+# first time they are used
+cores = None
+numa_nodes = None
+cache_groups = None
+
+# How many pinned jobs are on each core and NUMA node
+_core_jobs = []
+_node_jobs = []
+
+
+def _read_proc_stat():
+	# Get the time spent in each state from the first line, which adds up all the cpus
+	with open('/proc/stat', 'r') as f:
+		line = f.readline()
+	times = [int(n) for n in line.split()[1:]]
+
+	# user nice system idle iowait irq softirq steal
+	times = (times + [0] * 8)[0 : 8]
+	idle = times[3]
+	iowait = times[4]
+	total = sum(times)
+	return total, idle, iowait
+
+def _read_load_average():
+	if not os.path.isfile('/proc/loadavg'):
+		return None
+
+	with open('/proc/loadavg', 'r') as f:
+		return float(f.read().split()[0])
+
+def _read_cpu_pressure():
+	# Pressure Stall Information is only in newer Linux kernels
+	if not os.path.isfile('/proc/pressure/cpu'):
+		return None
+
+	# Get the percent of time some tasks were waiting on the cpu, in the last 10 seconds
+	with open('/proc/pressure/cpu', 'r') as f:
+		for line in f.readlines():
+			if line.startswith('some '):
+				return float(line.split('avg10=')[1].split()[0])
+
+	return None
+
+def _read_meminfo():
+	if not os.path.isfile('/proc/meminfo'):
+		return None, None
+
+	# Get the total and available memory in bytes
+	info = {}
+	with open('/proc/meminfo', 'r') as f:
+		for line in f.readlines():
+			parts = line.split()
+			if len(parts) >= 2:
+				info[parts[0].rstrip(':')] = int(parts[1]) * 1024
+
+	return info.get('MemTotal'), info.get('MemAvailable')
+
+def _read_memory_pressure():
+	# Pressure Stall Information is only in newer Linux kernels
+	if not os.path.isfile('/proc/pressure/memory'):
+		return None
+
+	# Get the percent of time some tasks were waiting on memory, in the last 10 seconds
+	with open('/proc/pressure/memory', 'r') as f:
+		for line in f.readlines():
+			if line.startswith('some '):
+				return float(line.split('avg10=')[1].split()[0])
+
+	return None
+
+def _parse_cpu_list(text):
+	# Get the cpus in a list like "0-3,8,10-11"
+	cpus = []
+	for part in text.strip().split(','):
+		if '-' in part:
+			start, end = part.split('-', 1)
+			cpus += range(int(start), int(end) + 1)
+		elif part:
+			cpus.append(int(part))
+	return cpus
+
+def _read_cpu_list(file_name):
+	try:
+		with open(file_name, 'r') as f:
+			return _parse_cpu_list(f.read())
+	except (IOError, OSError, ValueError):
+		return []
+
+def _read_affinity_cpus():
+	# Get the number of cpus this process is allowed to run on
+	if hasattr(os, 'sched_getaffinity'):
+		try:
+			return len(os.sched_getaffinity(0))
+		except OSError:
+			return None
+
+	# Or read it from the kernel, if Python is too old to have sched_getaffinity
+	if not os.path.isfile('/proc/self/status'):
+		return None
+
+	with open('/proc/self/status', 'r') as f:
+		for line in f.readlines():
+			if line.startswith('Cpus_allowed_list:'):
+				try:
+					return len(_parse_cpu_list(line.split(':', 1)[1]))
+				except ValueError:
+					return None
+
+	return None
+
+def _read_cgroup_quota(dir_name, fs_type):
+	# Get the cpu quota and period of a cgroup, in microseconds
+	try:
+		if fs_type == 'cgroup2':
+			with open(os.path.join(dir_name, 'cpu.max'), 'r') as f:
+				quota, period = f.read().split()[0 : 2]
+			if quota == 'max':
+				return None
+		else:
+			with open(os.path.join(dir_name, 'cpu.cfs_quota_us'), 'r') as f:
+				quota = f.read()
+			with open(os.path.join(dir_name, 'cpu.cfs_period_us'), 'r') as f:
+				period = f.read()
+		quota, period = int(quota), int(period)
+	except (IOError, OSError, ValueError):
+		return None
+
+	# A quota of -1 means there is no limit
+	if quota <= 0 or period <= 0:
+		return None
+
+	# Round up, so a quota of 1.5 cpus can still run 2 jobs
+	return max(int(math.ceil(float(quota) / period)), 1)
+
+def _read_cgroup_cpus(cgroup_file = '/proc/self/cgroup', mountinfo_file = '/proc/self/mountinfo'):
+	# Get the number of cpus the cgroup cpu quota allows, for cgroups v1 or v2
+	if not os.path.isfile(cgroup_file) or not os.path.isfile(mountinfo_file):
+		return None
+
+	# Get the cgroup of this process, for the cpu controller and for v2
+	paths = {}
+	with open(cgroup_file, 'r') as f:
+		for line in f.readlines():
+			parts = line.strip().split(':', 2)
+			if len(parts) != 3:
+				continue
+			hierarchy, controllers, path = parts
+			if hierarchy == '0' and not controllers:
+				paths['cgroup2'] = path
+			elif 'cpu' in controllers.split(','):
+				paths['cgroup'] = path
+
+	# Find where those cgroups are mounted
+	limits = []
+	with open(mountinfo_file, 'r') as f:
+		for line in f.readlines():
+			if not ' - ' in line:
+				continue
+			left, right = line.split(' - ', 1)
+			left, right = left.split(), right.split()
+			if len(left) < 5 or len(right) < 3:
+				continue
+			root, mount_point = left[3], left[4]
+			fs_type, options = right[0], right[2].split(',')
+			if not fs_type in paths or (fs_type == 'cgroup' and not 'cpu' in options):
+				continue
+
+			# Get the dir of the cgroup, under where it is mounted
+			path = paths[fs_type]
+			if root != '/' and path.startswith(root):
+				path = path[len(root) : ]
+			dir_name = os.path.normpath(os.path.join(mount_point, path.lstrip('/')))
+
+			# The quotas of the parent cgroups also apply, so check up to the mount
+			while True:
+				cpus = _read_cgroup_quota(dir_name, fs_type)
+				if cpus:
+					limits.append(cpus)
+				if len(dir_name) <= len(mount_point):
+					break
+				dir_name = os.path.dirname(dir_name)
+
+	if not limits:
+		return None
+	return min(limits)
+
+def _get_cpus_available():
+	# Get the number of cpus we can use. Inside containers this is often much
+	# less than the cpus on the machine, because of the affinity or cgroup quota
+	counts = [cpus_total, _read_affinity_cpus(), _read_cgroup_cpus()]
+	return max(min([count for count in counts if count]), 1)
+
+def _get_allowed_cpus():
+	if hasattr(os, 'sched_getaffinity'):
+		try:
+			return set(os.sched_getaffinity(0))
+		except OSError:
+			pass
+	return None
+
+def _group_cpus(groups, allowed):
+	# Remove the cpus we can't use, and the groups that are the same or empty
+	retval = []
+	for group in groups:
+		group = sorted([cpu for cpu in group if allowed == None or cpu in allowed])
+		if group and not group in retval:
+			retval.append(group)
+	retval.sort()
+	return retval
+
+def _read_topology():
+	global cores
+	global numa_nodes
+	global cache_groups
+	global _core_jobs
+	global _node_jobs
+
+	cpu_dir = '/sys/devices/system/cpu'
+	node_dir = '/sys/devices/system/node'
+	allowed = _get_allowed_cpus()
+	core_groups = []
+	node_groups = []
+	caches = {}
+
+	# Get the hyper threads on the same physical core, and the caches they share
+	if os.path.isdir(cpu_dir):
+		for entry in sorted(os.listdir(cpu_dir)):
+			if not re.match(r'^cpu\d+$', entry):
+				continue
+			cpu = int(entry[3 : ])
+			siblings = _read_cpu_list(os.path.join(cpu_dir, entry, 'topology', 'thread_siblings_list'))
+			core_groups.append(siblings or [cpu])
+
+			cache_dir = os.path.join(cpu_dir, entry, 'cache')
+			if not os.path.isdir(cache_dir):
+				continue
+			for index in os.listdir(cache_dir):
+				if not index.startswith('index'):
+					continue
+				try:
+					with open(os.path.join(cache_dir, index, 'level'), 'r') as f:
+						level = int(f.read())
+					with open(os.path.join(cache_dir, index, 'type'), 'r') as f:
+						cache_type = f.read().strip()
+				except (IOError, OSError, ValueError):
+					continue
+				if cache_type != 'Instruction':
+					shared = _read_cpu_list(os.path.join(cache_dir, index, 'shared_cpu_list'))
+					caches.setdefault(level, []).append(shared or [cpu])
+
+	# Get the cpus on each NUMA node
+	if os.path.isdir(node_dir):
+		for entry in sorted(os.listdir(node_dir)):
+			if re.match(r'^node\d+$', entry):
+				node_groups.append(_read_cpu_list(os.path.join(node_dir, entry, 'cpulist')))
+
+	# If the kernel does not say, treat each cpu as a core on one node
+	all_cpus = sorted(allowed or range(cpus_total))
+	cores = _group_cpus(core_groups, allowed) or [[cpu] for cpu in all_cpus]
+	numa_nodes = _group_cpus(node_groups, allowed) or [all_cpus]
+	cache_groups = {}
+	for level, groups in caches.items():
+		cache_groups[level] = _group_cpus(groups, allowed)
+
+	_core_jobs = [0] * len(cores)
+	_node_jobs = [0] * len(numa_nodes)
+
+def get_cores():
+	# Each physical core, as a list of its hyper threads
+	if cores == None:
+		_read_topology()
+	return cores
+
+def get_numa_nodes():
+	if numa_nodes == None:
+		_read_topology()
+	return numa_nodes
+
+def get_cache_groups(level):
+	# The cpus that share each cache of a level, like 2 for L2 or 3 for L3
+	if cache_groups == None:
+		_read_topology()
+	return cache_groups.get(level, [])
+
+def _get_node_of(cpus):
+	for i, node in enumerate(numa_nodes):
+		if cpus[0] in node:
+			return i
+	return 0
+
+def pin_job(is_memory_heavy = False):
+	# Pick the cpus for a job that is about to start. It is started on them,
+	# so the programs it starts run on them too.
+	# Only pin if asked, as it can be slower if other programs use the cpus
+	if not Config.is_pin or not hasattr(os, 'sched_setaffinity'):
+		return None
+	get_cores()
+
+	# Spread jobs that use a lot of memory across the NUMA nodes, so each
+	# uses the memory next to it. And put other jobs on the least used core
+	if is_memory_heavy:
+		node = min(range(len(numa_nodes)), key=lambda i: _node_jobs[i])
+		core = None
+		cpus = numa_nodes[node]
+	else:
+		core = min(range(len(cores)), key=lambda i: (_core_jobs[i], _node_jobs[_get_node_of(cores[i])]))
+		node = _get_node_of(cores[core])
+		cpus = cores[core]
+
+	if core != None:
+		_core_jobs[core] += 1
+	_node_jobs[node] += 1
+	return (core, node, cpus)
+
+def get_pinned_cpus(pinned):
+	if not pinned:
+		return None
+	return pinned[2]
+
+def unpin_job(pinned):
+	if not pinned:
+		return
+
+	core, node, cpus = pinned
+	if core != None:
+		_core_jobs[core] -= 1
+	_node_jobs[node] -= 1
+
+def _get_proc_stat_utilization_thread():
+	global cpu_utilization
+	global cpu_iowait
+	global load_average
+	global cpu_pressure
+	global memory_total
+	global memory_available
+	global memory_pressure
+
+	prev_total, prev_idle, prev_iowait = _read_proc_stat()
+	while is_utilization_thread_running:
+		time.sleep(sample_interval)
+
+		# Get the cpu percentages from how much the times changed since the last sample
+		total, idle, iowait = _read_proc_stat()
+		delta = total - prev_total
+		if delta > 0:
+			cpu_utilization = 100.0 * (delta - (idle - prev_idle) - (iowait - prev_iowait)) / delta
+			cpu_iowait = 100.0 * (iowait - prev_iowait) / delta
+		prev_total, prev_idle, prev_iowait = total, idle, iowait
+
+		load_average = _read_load_average()
+		cpu_pressure = _read_cpu_pressure()
+		memory_total, memory_available = _read_meminfo()
+		memory_pressure = _read_memory_pressure()
 
 def _get_utilization_thread():
 	global cpu_utilization
 	global is_utilization_thread_running
 
 	is_utilization_thread_running = True
+
+	# Use the kernel's cpu times if we can, as it is much cheaper than running top
+	if os.path.isfile('/proc/stat'):
+		_get_proc_stat_utilization_thread()
+		return
+
 	while is_utilization_thread_running:
 		# Get the cpu percentages
 		speed = 0
@@ -145,6 +531,145 @@ def get_utilization():
 	global cpu_utilization
 	return cpu_utilization
 
+def get_iowait():
+	global cpu_iowait
+	return cpu_iowait
+
+def get_load_average():
+	global load_average
+	return load_average
+
+def get_pressure():
+	global cpu_pressure
+	return cpu_pressure
+
+def start_jobs():
+	global jobs_min
+	global jobs_max
+	global jobs_limit
+	global jobs_first_limit
+	global _window_start
+	global _window_done
+
+	# Get the limits. At least one job is always run, so the build can't get stuck
+	jobs_min = max(Config.jobs_min or 1, 1)
+	jobs_max = max(Config.jobs or cpus_available * 4, jobs_min)
+
+	# Start with a job per cpu. Or keep the level from the last group of jobs
+	if jobs_limit == None:
+		jobs_limit = cpus_available
+	jobs_limit = min(max(jobs_limit, jobs_min), jobs_max)
+	if jobs_first_limit == None:
+		jobs_first_limit = jobs_limit
+
+	_window_start = time.time()
+	_window_done = 0
+	_update_free()
+
+def job_started():
+	global jobs_running
+	global jobs_peak
+
+	jobs_running += 1
+	jobs_peak = max(jobs_peak, jobs_running)
+	_update_free()
+
+def job_done():
+	global jobs_running
+	global _window_done
+
+	jobs_running -= 1
+	_window_done += 1
+
+	# Change the number of jobs if enough time has passed to measure
+	now = time.time()
+	if now - _window_start >= control_interval:
+		_adjust_jobs(now)
+	_update_free()
+
+def _adjust_jobs(now):
+	global jobs_limit
+	global _window_start
+	global _window_done
+	global _last_throughput
+	global _last_limit
+
+	throughput = _window_done / (now - _window_start)
+
+	# The machine is overloaded if tasks are waiting a lot on the cpus
+	if cpu_pressure != None:
+		is_overloaded = cpu_pressure > 40.0
+	else:
+		is_overloaded = load_average != None and load_average > cpus_total * 2
+
+	# Did the last increase make things slower?
+	is_slower = _last_throughput != None and _last_limit < jobs_limit and \
+		throughput < _last_throughput * 0.9
+
+	_last_throughput = throughput
+	_last_limit = jobs_limit
+
+	# Back off quickly if it is overloaded or slower
+	if is_overloaded or is_slower:
+		jobs_limit = max(int(jobs_limit * 0.75), jobs_min)
+	# Add a job if the cpus are not busy, or if the jobs are waiting on the disk
+	elif get_utilization() < 90.0 or get_iowait() > 10.0:
+		jobs_limit = min(jobs_limit + 1, jobs_max)
+
+	_window_start = now
+	_window_done = 0
+
+def job_killed():
+	global jobs_limit
+	global jobs_running
+
+	# A job was killed, probably for using too much memory. So halve the jobs
+	jobs_running -= 1
+	jobs_limit = max(jobs_limit // 2, jobs_min)
+	_update_free()
+
+def has_memory_for(size):
+	# Say yes if we can't tell how much memory is free
+	if memory_available == None or memory_total == None:
+		return True
+
+	# Wait if tasks are already stalling on memory
+	if memory_pressure != None and memory_pressure > 10.0:
+		return False
+
+	# Keep some memory free for everything else
+	return memory_available - size > memory_total * memory_reserve
+
+def _update_free():
+	global cpus_free
+
+	cpus_free = jobs_limit - jobs_running
+
+def get_cpus_available():
+	global cpus_available
+	return cpus_available
+
+def get_memory_available():
+	global memory_available
+	return memory_available
+
+def get_memory_pressure():
+	global memory_pressure
+	return memory_pressure
+
+def get_jobs_limit():
+	global jobs_limit
+	return jobs_limit
+
+def get_jobs_peak():
+	global jobs_peak
+	return jobs_peak
+
+def is_jobs_limit_changed():
+	global jobs_limit
+	global jobs_first_limit
+	return jobs_first_limit != None and jobs_limit != jobs_first_limit
+
 def start_get_utilization_thread():
 	global utilization_thread
 
@@ -160,6 +685,7 @@ def setup():
 	global vendor_name
 	global flags
 	global cpus_total
+	global cpus_available
 	global cpus_free
 
 	info = cpuinfo.get_cpu_info()
@@ -192,7 +718,8 @@ def setup():
 
 	# Figure out how many cpus there are
 	cpus_total = info['count']
-	cpus_free = cpus_total
+	cpus_available = _get_cpus_available()
+	cpus_free = cpus_available
 
 	start_get_utilization_thread()
 
@@ -34,8 +34,10 @@ import lib_raise_terminal as Print
 import lib_raise_users as Users
 import lib_raise_find as Find
 import lib_raise_fs as FS
+import lib_raise_db as DB
 import lib_raise_process as Process
 import lib_raise_helpers as Helpers
+import lib_raise_trace as Trace
 
 from osinfo import *
 import findlib
@@ -149,11 +151,13 @@ class CSCompiler(object):
 		)
 		command = to_native(command)
 
+		# Get the files the event reads and writes
+		to_update = [to_native(out_file)]
+		triggers = [to_native(t) for t in inc_files + link_files]
+
 		def setup():
 			# Skip if the files have not changed since last build
-			to_update = [to_native(out_file)]
-			triggers = [to_native(t) for t in inc_files + link_files]
-			if not FS.is_outdated(to_update, triggers):
+			if not DB.is_outdated(to_update, triggers, command):
 				return False
 
 			# Create the output directory if it does not exist
@@ -162,7 +166,7 @@ class CSCompiler(object):
 			return True
 
 		# Create the event
-		event = Process.Event(task, result, plural, singular, command, setup)
+		event = Process.Event(task, result, plural, singular, command, setup, triggers, to_update)
 		Process.add_event(event)
 
 	def build_shared_library(self, out_file, inc_files, link_files=[]):
@@ -185,11 +189,13 @@ class CSCompiler(object):
 		)
 		command = to_native(command)
 
+		# Get the files the event reads and writes
+		to_update = [to_native(out_file)]
+		triggers = [to_native(t) for t in inc_files + link_files]
+
 		def setup():
 			# Skip if the files have not changed since last build
-			to_update = [to_native(out_file)]
-			triggers = [to_native(t) for t in inc_files + link_files]
-			if not FS.is_outdated(to_update, triggers):
+			if not DB.is_outdated(to_update, triggers, command):
 				return False
 
 			# Create the output directory if it does not exist
@@ -198,10 +204,11 @@ class CSCompiler(object):
 			return True
 
 		# Create the event
-		event = Process.Event(task, result, plural, singular, command, setup)
+		event = Process.Event(task, result, plural, singular, command, setup, triggers, to_update)
 		Process.add_event(event)
 
 	def run_print(self, command):
+		Process.wait_for_events()
 		Print.status("Running C# program")
 
 		native_command = '{0} {1}'.format(self._runtime, command)
@@ -211,6 +218,7 @@ class CSCompiler(object):
 		runner.run()
 		runner.is_done
 		runner.wait()
+		FS.clear_stat_cache()
 
 		if runner.is_success or runner.is_warning:
 			Print.ok()
@@ -241,10 +249,7 @@ def to_native(command):
 			'.dll' : '.dll'
 		}
 
-	for before, after in extension_map.items():
-		command = command.replace(before, after)
-
-	return command
+	return Helpers.replace_extensions(command, extension_map)
 
 def get_default_compiler():
 	global cs_compilers
@@ -389,4 +394,4 @@ def uninstall_library(name, dir_name):
 					"Failed to uninstall the library '{0}'.".format(name),
 				lambda: fn())
 
-setup()
+Trace.call('Setting up C# module', 'setup', setup)
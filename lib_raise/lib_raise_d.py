@@ -32,9 +32,11 @@ import lib_raise_config as Config
 import lib_raise_terminal as Print
 import lib_raise_users as Users
 import lib_raise_fs as FS
+import lib_raise_db as DB
 import lib_raise_find as Find
 import lib_raise_process as Process
 import lib_raise_helpers as Helpers
+import lib_raise_trace as Trace
 
 from osinfo import *
 import findlib
@@ -161,6 +163,10 @@ class DCompiler(object):
 		self.unittest = False
 		self.compile_time_flags = []
 
+		# The scheduler pools that objects and programs are run in
+		self.compile_pool = None
+		self.link_pool = 'link'
+
 	def get_dc(self):
 		return self._name
 	dc = property(get_dc)
@@ -203,17 +209,22 @@ class DCompiler(object):
 		)
 		command = to_native(command)
 
+		# Leave the temp file out of the command that is saved
+		signature = command.replace(f.name, '')
+
+		# Get the files the event reads and writes
+		to_update = [d_file+'i']
+		triggers = [to_native(t) for t in i_files]
+
 		def setup():
 			# Skip if the files have not changed since last build
-			to_update = [d_file+'i']
-			triggers = [to_native(t) for t in i_files]
-			if not FS.is_outdated(to_update, triggers):
+			if not DB.is_outdated(to_update, triggers, signature):
 				return False
 
 			return True
 
 		# Create the event
-		event = Process.Event(task, result, plural, singular, command, setup)
+		event = Process.Event(task, result, plural, singular, command, setup, triggers, to_update, signature=signature, pool=self.compile_pool)
 		Process.add_event(event)
 
 	def build_object(self, o_file, d_files, i_files=[], l_files=[], h_file='', h_dir=''):
@@ -250,12 +261,14 @@ class DCompiler(object):
 			)
 		command = to_native(command)
 
+		# Get the files the event reads and writes
+		to_update = [to_native(o_file)]
+		triggers = [to_native(t) for t in d_files + i_files + l_files]
+		if h_file: triggers.append(h_file)
+
 		def setup():
 			# Skip if the files have not changed since last build
-			to_update = [to_native(o_file)]
-			triggers = [to_native(t) for t in d_files + i_files + l_files]
-			if h_file: triggers.append(h_file)
-			if not FS.is_outdated(to_update, triggers):
+			if not DB.is_outdated(to_update, triggers, command):
 				return False
 
 			# Create the output directory if it does not exist
@@ -263,8 +276,9 @@ class DCompiler(object):
 
 			return True
 
-		# Create the event
-		event = Process.Event(task, result, plural, singular, command, setup)
+		# Create the event. Only cache it if it does not also write interfaces
+		is_cached = not h_file and not h_dir
+		event = Process.Event(task, result, plural, singular, command, setup, triggers, to_update, cache=is_cached, pool=self.compile_pool)
 		Process.add_event(event)
 
 	def build_static_library(self, o_file, d_files, i_files=[], l_files=[], generate_headers=False):
@@ -294,11 +308,13 @@ class DCompiler(object):
 			)
 		command = to_native(command)
 
+		# Get the files the event reads and writes
+		to_update = [to_native(o_file)]
+		triggers = [to_native(t) for t in d_files + i_files + l_files]
+
 		def setup():
 			# Skip if the files have not changed since last build
-			to_update = [to_native(o_file)]
-			triggers = [to_native(t) for t in d_files + i_files + l_files]
-			if not FS.is_outdated(to_update, triggers):
+			if not DB.is_outdated(to_update, triggers, command):
 				return False
 
 			# Create the output directory if it does not exist
@@ -307,7 +323,7 @@ class DCompiler(object):
 			return True
 
 		# Create the event
-		event = Process.Event(task, result, plural, singular, command, setup)
+		event = Process.Event(task, result, plural, singular, command, setup, triggers, to_update, pool=self.compile_pool)
 		Process.add_event(event)
 
 	def build_program(self, out_file, inc_files, link_files=[]):
@@ -329,11 +345,13 @@ class DCompiler(object):
 		)
 		command = to_native(command)
 
+		# Get the files the event reads and writes
+		to_update = [to_native(out_file)]
+		triggers = [to_native(t) for t in inc_files + link_files]
+
 		def setup():
 			# Skip if the files have not changed since last build
-			to_update = [to_native(out_file)]
-			triggers = [to_native(t) for t in inc_files + link_files]
-			if not FS.is_outdated(to_update, triggers):
+			if not DB.is_outdated(to_update, triggers, command):
 				return False
 
 			# Create the output directory if it does not exist
@@ -342,7 +360,7 @@ class DCompiler(object):
 			return True
 
 		# Create the event
-		event = Process.Event(task, result, plural, singular, command, setup)
+		event = Process.Event(task, result, plural, singular, command, setup, triggers, to_update, pool=self.link_pool)
 		Process.add_event(event)
 
 
@@ -371,10 +389,7 @@ def to_native(command):
 			'.a' : '.a'
 		}
 
-	for before, after in extension_map.items():
-		command = command.replace(before, after)
-
-	return command
+	return Helpers.replace_extensions(command, extension_map)
 
 def get_default_compiler():
 	global d_compilers
@@ -386,6 +401,7 @@ def get_default_compiler():
 	return None
 
 def run_print(command):
+	Process.wait_for_events()
 	Print.status("Running D program")
 
 	native_command = to_native(command)
@@ -393,6 +409,7 @@ def run_print(command):
 	runner.run()
 	runner.is_done
 	runner.wait()
+	FS.clear_stat_cache()
 
 	if runner.is_success or runner.is_warning:
 		Print.ok()
@@ -578,4 +595,4 @@ def uninstall_interface(name, dir_name=None):
 					"Failed to uninstall the interface '{0}'.".format(name),
 				lambda: fn())
 
-setup()
+Trace.call('Setting up D module', 'setup', setup)
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# This file is part of Raise.
+# Raise is a small build automation tool that ships with your software.
+# Raise uses a MIT style license, and is hosted at https://github.com/workhorsy/raise .
+# Copyright (c) 2012-2017 Matthew Brennan Jones <matthew.brennan.jones@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+import json
+import hashlib
+import atexit
+import findlib
+import lib_raise_fs as FS
+
+
+db_file = None
+db_handle = None
+file_hashes = {}
+outputs = {}
+pending_inputs = {}
+signatures = {}
+record_count = 0
+
+
+# The build database is a log of JSON records, one per line. Records are
+# only ever appended, and the last record for a file wins. So if Raise is
+# killed while writing, only the half written last line is lost.
+def setup():
+	global db_file
+
+	db_file = os.path.abspath('.raise_db')
+	_load()
+
+def _load():
+	global record_count
+
+	if not os.path.isfile(db_file):
+		return
+
+	with open(db_file, 'r') as f:
+		for line in f:
+			# Skip any lines that were not completely written
+			try:
+				record = json.loads(line)
+			except ValueError:
+				continue
+
+			record_count += 1
+			if record.get('type') == 'hash':
+				file_hashes[record['file']] = record
+			elif record.get('type') == 'output':
+				outputs[record['file']] = record
+
+	if _is_mostly_old_records():
+		_compact()
+
+def _is_mostly_old_records():
+	# Rewrite the log if it is mostly records that were replaced by newer ones
+	live_count = len(file_hashes) + len(outputs)
+	return record_count > live_count * 2 + 1000
+
+def _ends_with_newline():
+	# False if the last line was not completely written, such as on a crash
+	if not os.path.isfile(db_file) or os.path.getsize(db_file) == 0:
+		return True
+
+	with open(db_file, 'rb') as f:
+		f.seek(-1, os.SEEK_END)
+		return f.read(1) == b'\n'
+
+def _compact():
+	global db_handle
+	global record_count
+
+	if db_handle:
+		db_handle.close()
+		db_handle = None
+
+	# Write the live records to a new file, then move it over the old one
+	temp_file = db_file + '.tmp'
+	with open(temp_file, 'w') as f:
+		for record in list(file_hashes.values()) + list(outputs.values()):
+			f.write(json.dumps(record) + '\n')
+		f.flush()
+		os.fsync(f.fileno())
+
+	if os.path.isfile(db_file) and os.name == 'nt':
+		os.remove(db_file)
+	os.rename(temp_file, db_file)
+	record_count = len(file_hashes) + len(outputs)
+
+def _append(record):
+	global db_handle
+	global record_count
+
+	if not db_handle:
+		# Start on a new line, so the record is not lost after a half written one
+		is_torn = not _ends_with_newline()
+		db_handle = open(db_file, 'a')
+		if is_torn:
+			db_handle.write('\n')
+
+	db_handle.write(json.dumps(record) + '\n')
+	db_handle.flush()
+	record_count += 1
+
+	if _is_mostly_old_records():
+		_compact()
+
+def _to_key(file_name):
+	return os.path.normcase(os.path.abspath(file_name))
+
+def _get_mtime_ns(st):
+	if hasattr(st, 'st_mtime_ns'):
+		return st.st_mtime_ns
+	return int(st.st_mtime * 1000000000)
+
+def get_hash(file_name):
+	key = _to_key(file_name)
+
+	# Return None if not a file
+	st = FS.get_stat(key)
+	if st is None:
+		return None
+
+	# Use the saved hash if the file has the same inode, size, and date
+	inode, size, mtime = st.st_ino, st.st_size, _get_mtime_ns(st)
+	record = file_hashes.get(key)
+	if record and record['inode'] == inode and record['size'] == size and record['mtime'] == mtime:
+		return record['hash']
+
+	# Otherwise hash the file contents
+	h = hashlib.sha1()
+	with open(key, 'rb') as f:
+		while True:
+			chunk = f.read(65536)
+			if not chunk:
+				break
+			h.update(chunk)
+
+	record = {
+		'type' : 'hash',
+		'file' : key,
+		'inode' : inode,
+		'size' : size,
+		'mtime' : mtime,
+		'hash' : h.hexdigest()
+	}
+	file_hashes[key] = record
+	_append(record)
+
+	return record['hash']
+
+def _get_input_hashes(triggers):
+	hashes = {}
+	for trigger in triggers:
+		hashes[_to_key(trigger)] = get_hash(trigger)
+	return hashes
+
+def _to_bytes(s):
+	if isinstance(s, bytes):
+		return s
+	return s.encode('utf-8')
+
+def _get_program(command):
+	# Get the program from the start of the command
+	if command.startswith('"'):
+		program = command[1 : ].split('"', 1)[0]
+	else:
+		program = command.split(' ', 1)[0]
+
+	# Look in the PATH if it is not a file
+	if not FS.is_file(program):
+		paths = findlib.program_paths(program)
+		if paths:
+			program = paths[0]
+
+	return program
+
+def get_signature(command):
+	# Use the saved signature if there is one
+	if command in signatures:
+		return signatures[command]
+
+	# Hash the command and the program it runs. So the outputs are rebuilt if
+	# the flags change, or if the compiler is upgraded
+	program_hash = get_hash(_get_program(command)) or ''
+	h = hashlib.sha1()
+	h.update(_to_bytes(command))
+	h.update(_to_bytes(program_hash))
+	signatures[command] = h.hexdigest()
+
+	return signatures[command]
+
+def is_outdated(to_update, triggers, command, needs_deps = False):
+	to_update = FS.glob_names(to_update)
+	triggers = FS.glob_names(triggers)
+
+	# Return true if any of the files to check do not exist
+	for update in to_update:
+		if not FS.is_file(update):
+			return True
+
+	# Drop any entries that are not files
+	triggers = [entry for entry in triggers if FS.is_file(entry)]
+
+	signature = get_signature(command)
+	is_any_outdated = False
+	inputs_before = {}
+	for update in to_update:
+		key = _to_key(update)
+		record = outputs.get(key)
+
+		# Get the hashes of the triggers, and any headers used last time
+		deps = []
+		if record:
+			deps = record.get('deps', [])
+		inputs = _get_input_hashes(triggers + deps)
+		inputs_before[key] = inputs
+
+		# If we have never built the file, fall back to checking the file dates.
+		# And start tracking the file if it is up to date. Files that need
+		# their header dependencies are always built, to find the headers
+		if not record:
+			if needs_deps or FS.is_outdated([update], triggers):
+				is_any_outdated = True
+			else:
+				_save_output(key, inputs, signature, [])
+		# Rebuild if the file, the files it was built from, or the command have changed
+		elif record['hash'] != get_hash(update) or record['inputs'] != inputs or \
+			record.get('signature') != signature:
+			is_any_outdated = True
+
+	# Save the input hashes from before the build, so any changes made
+	# while building will be caught next time
+	if is_any_outdated:
+		pending_inputs.update(inputs_before)
+
+	return is_any_outdated
+
+def get_duration(file_name):
+	# Get how many seconds it took to build the file last time
+	record = outputs.get(_to_key(file_name))
+	if record:
+		return record.get('duration')
+	return None
+
+def get_memory(file_name):
+	# Get the most bytes of memory used to build the file last time
+	record = outputs.get(_to_key(file_name))
+	if record:
+		return record.get('memory')
+	return None
+
+def save_outputs(to_update, triggers, command, deps = None, duration = None, memory = None):
+	signature = get_signature(command)
+	triggers = [entry for entry in FS.glob_names(triggers) if FS.is_file(entry)]
+	deps = [_to_key(dep) for dep in deps or []]
+
+	for update in FS.glob_names(to_update):
+		key = _to_key(update)
+		if not FS.is_file(key):
+			continue
+
+		# Use the input hashes from before the build, and hash any new headers
+		inputs_before = pending_inputs.pop(key, {})
+		inputs = {}
+		for trigger in [_to_key(t) for t in triggers] + deps:
+			if trigger in inputs_before:
+				inputs[trigger] = inputs_before[trigger]
+			else:
+				inputs[trigger] = get_hash(trigger)
+
+		_save_output(key, inputs, signature, deps, duration, memory)
+
+def _save_output(key, inputs, signature, deps, duration = None, memory = None):
+	record = {
+		'type' : 'output',
+		'file' : key,
+		'hash' : get_hash(key),
+		'inputs' : inputs,
+		'signature' : signature,
+		'deps' : deps
+	}
+
+	# Keep the duration and memory from last time, if it was not built this time
+	if duration == None and key in outputs:
+		duration = outputs[key].get('duration')
+	if duration != None:
+		record['duration'] = duration
+	if memory == None and key in outputs:
+		memory = outputs[key].get('memory')
+	if memory != None:
+		record['memory'] = memory
+
+	outputs[key] = record
+	_append(record)
+
+def exit_module():
+	global db_handle
+
+	if db_handle:
+		db_handle.close()
+		db_handle = None
+
+setup()
+atexit.register(exit_module)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# This file is part of Raise.
+# Raise is a small build automation tool that ships with your software.
+# Raise uses a MIT style license, and is hosted at https://github.com/workhorsy/raise .
+# Copyright (c) 2012-2017 Matthew Brennan Jones <matthew.brennan.jones@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+import socket
+import threading
+import lib_raise_config as Config
+import build_worker
+import findlib
+
+
+# The default number of jobs to send to a worker at once
+default_slots = 4
+
+workers = None
+workers_text = None
+
+
+class Job(object):
+	def __init__(self, preprocess_command, preprocessed_file, args, extension, out_file):
+		self.preprocess_command = preprocess_command
+		self.preprocessed_file = preprocessed_file
+		self.args = args
+		self.extension = extension
+		self.out_file = out_file
+
+class Worker(object):
+	def __init__(self, hostname, port, slots):
+		self.client = build_worker.WorkerClient(hostname, port)
+		self.slots_free = slots
+		self.is_broken = False
+
+# Runs a compile on a worker in a thread. Looks like a ProcessRunner to the
+# scheduler, by giving it a pipe that is closed when the compile is done
+class RemoteRunner(findlib.ProcessRunner):
+	def __init__(self, command, job):
+		super(RemoteRunner, self).__init__(command)
+		self._job = job
+		self._worker = None
+		self._thread = None
+		self._result = None
+
+	def run(self):
+		# Take a slot on the worker with the most free
+		self._worker = _get_best_worker()
+		self._worker.slots_free -= 1
+
+		read_fd, self._write_fd = os.pipe()
+		self._pipes = {read_fd : None}
+		self._thread = threading.Thread(target=self._run_thread)
+		self._thread.daemon = True
+		self._thread.start()
+
+	def read_fd(self, fd):
+		# The pipe is empty when the thread is done
+		if not os.read(fd, 1024):
+			os.close(fd)
+			del self._pipes[fd]
+
+	def _run_thread(self):
+		try:
+			try:
+				self._result = self._run_remote()
+			except (socket.error, IOError, OSError, ValueError, KeyError):
+				# Stop using the worker, and build it here instead
+				self._worker.is_broken = True
+				self._result = self._run_local(self._command)
+		finally:
+			os.close(self._write_fd)
+
+	def _run_remote(self):
+		job = self._job
+
+		# Preprocess the source here
+		rc, stdout, stderr = self._run_local(job.preprocess_command)
+		if rc:
+			_remove_file(job.preprocessed_file)
+			return rc, stdout, stderr
+
+		# Compile it on the worker
+		with open(job.preprocessed_file, 'rb') as f:
+			data = f.read()
+		_remove_file(job.preprocessed_file)
+		rc, stdout, stderr, data = self._worker.client.compile(job.args, job.extension, data)
+
+		# Save the object
+		if rc == 0:
+			with open(job.out_file, 'wb') as f:
+				f.write(data)
+
+		return rc, stdout, stderr
+
+	def _run_local(self, command):
+		# In its own process group, so it is stopped with the other jobs
+		process = findlib.start_process(command, is_grouped = True)
+		try:
+			stdout, stderr = process.communicate()
+		finally:
+			findlib.process_groups.pop(process.pid, None)
+		return process.returncode, stdout, stderr
+
+	def _reap(self):
+		if self._thread:
+			self._thread.join()
+			self._thread = None
+			self._worker.slots_free += 1
+
+	def wait(self):
+		self._reap()
+		rc, stdout, stderr = self._result
+		self._set_output(rc, stdout, stderr)
+
+def setup():
+	pass
+
+def _remove_file(file_name):
+	if os.path.isfile(file_name):
+		os.remove(file_name)
+
+def get_workers():
+	global workers
+	global workers_text
+
+	# Get the workers in the form host:port/slots,host:port/slots
+	text = Config.workers or os.environ.get('RAISE_WORKERS') or ''
+	if text != workers_text:
+		workers_text = text
+		workers = []
+
+		# Windows can't wait on the pipes of threads
+		if os.name == 'nt':
+			return workers
+
+		for entry in text.split(','):
+			if not entry:
+				continue
+			slots = default_slots
+			if '/' in entry:
+				entry, slots = entry.split('/', 1)
+				slots = int(slots)
+			hostname, port = entry.rsplit(':', 1)
+			workers.append(Worker(hostname, int(port), slots))
+
+	return workers
+
+def is_enabled():
+	return len(get_workers()) > 0
+
+def is_allowed(args):
+	# Workers only run compiles with flags they know are safe
+	return build_worker.get_bad_arg(args) is None
+
+def has_workers():
+	return len([w for w in get_workers() if not w.is_broken]) > 0
+
+def get_slots_free():
+	return sum([w.slots_free for w in get_workers() if not w.is_broken])
+
+def _get_best_worker():
+	working = [w for w in get_workers() if not w.is_broken]
+	return max(working, key=lambda w: w.slots_free)
+
+
+setup()
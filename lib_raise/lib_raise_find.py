@@ -33,28 +33,33 @@ import lib_raise_terminal as Print
 import lib_raise_process as Process
 import lib_raise_helpers as Helpers
 import lib_raise_terminal as Terminal
+import lib_raise_trace as Trace
 
 import findlib
 import findlib_server
 from osinfo import *
 
 def program_paths(*program_names):
-	return findlib.program_paths(*program_names)
+	return Trace.call("Finding program '{0}'".format(program_names[0]), 'find',
+		lambda: findlib.program_paths(*program_names))
 
 def get_header_file(header_name, version_str = None):
-	return findlib.get_header_file(header_name, version_str)
+	return Trace.call("Finding header file '{0}'".format(header_name), 'find',
+		lambda: findlib.get_header_file(header_name, version_str))
 
 def get_static_library(lib_name, version_str = None):
-	return findlib.get_static_library(lib_name, version_str)
+	return Trace.call("Finding static library '{0}'".format(lib_name), 'find',
+		lambda: findlib.get_static_library(lib_name, version_str))
 
 def get_shared_library(lib_name, version_str = None):
-	return findlib.get_shared_library(lib_name, version_str)
+	return Trace.call("Finding shared library '{0}'".format(lib_name), 'find',
+		lambda: findlib.get_shared_library(lib_name, version_str))
 
 def require_header_file(header_name, version_str = None):
 	Print.status("Checking for header file '{0}'".format(header_name))
 
 	# If the header is not installed, make them install it to continue
-	if not findlib.get_header_file(header_name, version_str):
+	if not get_header_file(header_name, version_str):
 		ver = "(Any version)"
 		if version_str:
 			ver = version_str
@@ -69,7 +74,7 @@ def require_static_library(lib_name, version_str = None):
 	Print.status("Checking for static library '{0}'".format(lib_name))
 
 	# If the static library is not installed, make them install it to continue
-	if not findlib.get_static_library(lib_name, version_str):
+	if not get_static_library(lib_name, version_str):
 		# Get the version requirement lambda as a printable string
 		ver = "(Any version)"
 		if version_str:
@@ -85,7 +90,7 @@ def require_shared_library(lib_name, version_str = None):
 	Print.status("Checking for shared library '{0}'".format(lib_name))
 
 	# If the shared library is not installed, make them install it to continue
-	if not findlib.get_shared_library(lib_name, version_str):
+	if not get_shared_library(lib_name, version_str):
 		# Get the version requirement lambda as a printable string
 		ver = "(Any version)"
 		if version_str:
@@ -119,7 +124,7 @@ def require_static_or_shared_library(lib_name, version_str = None):
 def require_programs(prog_names):
 	for prog_name in prog_names:
 		Print.status("Checking for program '{0}'".format(prog_name))
-		if len(findlib.program_paths(prog_name)):
+		if len(program_paths(prog_name)):
 			Print.ok()
 		else:
 			Print.fail()
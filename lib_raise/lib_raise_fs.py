@@ -27,6 +27,7 @@
 
 import os
 import sys
+import stat
 import glob
 import tempfile, shutil, filecmp
 import atexit
@@ -36,6 +37,13 @@ import lib_raise_terminal as Print
 
 PY2 = sys.version_info[0] == 2
 
+# The stats of files and the listings of dirs. They are only saved while the
+# build events are run, as the rscript may change files between them. Raise
+# clears the entries for files it changes while the events run.
+stat_cache = {}
+dir_cache = {}
+is_stat_cache_on = False
+
 def is_string_like(thing):
 	if PY2:
 		return isinstance(thing, basestring)
@@ -58,7 +66,8 @@ def copy_file(source, dest):
 				lambda: shutil.copy2(source, dest))
 
 def copy_new_file(source, dest):
-	if not os.path.isfile(os.path.abspath(dest)):
+	Process.wait_for_events()
+	if not is_file(dest):
 		copy_file(source, dest)
 	elif not filecmp.cmp(source, dest):
 		copy_file(source, dest)
@@ -78,6 +87,7 @@ def make_dir(source, ignore_failure = False):
 					lambda: os.mkdir(source))
 
 def remove_dir(name, and_children = False):
+	Process.wait_for_events()
 	Print.status("Removing the dir '{0}'".format(name))
 	success = False
 
@@ -99,6 +109,7 @@ def remove_dir(name, and_children = False):
 	except OSError as e:
 		if 'No such file or directory' in e:
 			success = True
+	clear_stat_cache()
 
 	if success:
 		Print.ok()
@@ -107,6 +118,7 @@ def remove_dir(name, and_children = False):
 		Print.exit("Failed to remove the dir '{0}'.".format(name))
 
 def remove_file(name, ignore_failure = False):
+	Process.wait_for_events()
 	Print.status("Removing the file '{0}'".format(name))
 	success = False
 
@@ -120,6 +132,7 @@ def remove_file(name, ignore_failure = False):
 	except Exception as e:
 		if ignore_failure:
 			success = True
+	clear_stat_cache()
 
 	if success:
 		Print.ok()
@@ -128,6 +141,7 @@ def remove_file(name, ignore_failure = False):
 		Print.exit("Failed to remove the file '{0}'.".format(name))
 
 def remove_binaries(name):
+	Process.wait_for_events()
 	Print.status("Removing binaries '{0}'".format(name))
 
 	extensions = ['.exe', '.o', '.obj', '.so', '.a', '.dll', '.lib', '.pyc',
@@ -136,8 +150,10 @@ def remove_binaries(name):
 	for entry in os.listdir(os.getcwd()):
 		if entry.startswith(name) and os.path.isfile(entry):
 			extension = '.' + str.join('.', entry.lower().split('.')[1:])
-			if extension in extensions or entry == name:
+			is_precompiled_header = extension.endswith('.gch') or extension.endswith('.pch')
+			if extension in extensions or is_precompiled_header or entry == name:
 				os.remove(entry)
+	clear_stat_cache()
 
 	Print.ok()
 
@@ -147,6 +163,10 @@ def symlink(source, link_name):
 				lambda: os.symlink(source, link_name))
 
 def glob_name(name):
+	# Skip reading the dir if the name has no wildcards
+	if not glob.has_magic(name):
+		return [name]
+
 	entries = []
 	globs = glob.glob(name)
 
@@ -183,21 +203,21 @@ def is_outdated(to_update, triggers):
 
 	# Return true if any of the files to check do not exist
 	for update in to_update:
-		if not os.path.isfile(os.path.abspath(update)):
+		if not is_file(update):
 			return True
 
 	# Drop any entries that are not files
-	to_update = [entry for entry in to_update if os.path.isfile(os.path.abspath(entry))]
-	triggers = [entry for entry in triggers if os.path.isfile(os.path.abspath(entry))]
+	to_update = [entry for entry in to_update if is_file(entry)]
+	triggers = [entry for entry in triggers if is_file(entry)]
 
 	# Get the modify date of the newest trigger file and file to check
 	newest_trigger, newest_update = 0, 0
 	for trigger in triggers:
-		t = os.path.getmtime(trigger)
+		t = get_mtime(trigger)
 		if t > newest_trigger:
 			newest_trigger = t
 	for update in to_update:
-		t = os.path.getmtime(update)
+		t = get_mtime(update)
 		if t > newest_update:
 			newest_update = t
 
@@ -209,8 +229,104 @@ def is_outdated(to_update, triggers):
 
 def create_path_dirs(path):
 	out_dir = os.path.dirname(path)
-	if out_dir and not os.path.isdir(out_dir):
+	if out_dir and not is_dir(out_dir):
 		os.makedirs(out_dir)
+		clear_stat_cache()
+
+def _to_key(path):
+	return os.path.normcase(os.path.abspath(path))
+
+def _list_dir(dir_key):
+	# Use the saved listing if there is one
+	if dir_key in dir_cache:
+		return dir_cache[dir_key]
+
+	# Otherwise read all the entries in the dir at once
+	entries = {}
+	try:
+		if hasattr(os, 'scandir'):
+			for entry in os.scandir(dir_key):
+				entries[os.path.normcase(entry.name)] = entry
+		else:
+			for name in os.listdir(dir_key):
+				entries[os.path.normcase(name)] = None
+	except OSError:
+		pass
+
+	if is_stat_cache_on:
+		dir_cache[dir_key] = entries
+	return entries
+
+def get_stat(path):
+	key = _to_key(path)
+
+	# Use the saved stat if there is one
+	if key in stat_cache:
+		return stat_cache[key]
+
+	# Just stat the file if the results are not saved. Listing the dir would
+	# cost more than it saves
+	if not is_stat_cache_on:
+		try:
+			return os.stat(key)
+		except OSError:
+			return None
+
+	# Skip the stat if the dir listing shows the file does not exist
+	dir_key, name = os.path.split(key)
+	st = None
+	try:
+		if not name:
+			st = os.stat(key)
+		else:
+			entries = _list_dir(dir_key)
+			if name in entries:
+				entry = entries[name]
+				if entry:
+					st = entry.stat()
+				else:
+					st = os.stat(key)
+	except OSError:
+		st = None
+
+	stat_cache[key] = st
+	return st
+
+def is_file(path):
+	st = get_stat(path)
+	return st is not None and stat.S_ISREG(st.st_mode)
+
+def is_dir(path):
+	st = get_stat(path)
+	return st is not None and stat.S_ISDIR(st.st_mode)
+
+def get_mtime(path):
+	return get_stat(path).st_mtime
+
+def forget_stats(paths):
+	# Remove the saved stats of the files, and the listings of their dirs
+	for path in glob_names(paths):
+		key = _to_key(path)
+		stat_cache.pop(key, None)
+		dir_cache.pop(key, None)
+		dir_cache.pop(os.path.dirname(key), None)
+
+def clear_stat_cache():
+	stat_cache.clear()
+	dir_cache.clear()
+
+def start_stat_cache():
+	global is_stat_cache_on
+
+	# Start with nothing saved, in case files were changed since last time
+	clear_stat_cache()
+	is_stat_cache_on = True
+
+def stop_stat_cache():
+	global is_stat_cache_on
+
+	clear_stat_cache()
+	is_stat_cache_on = False
 
 def self_deleting_named_temporary_file():
 	f = tempfile.NamedTemporaryFile(delete=False)
@@ -26,6 +26,7 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import os
+import re
 import atexit
 import platform
 import inspect
@@ -73,6 +74,14 @@ def require_file_extension(file_name, *required_extensions):
 	if not extension in required_extensions:
 		Print.exit("File extension should be '{0}' on '{1}'.".format(str.join(', ', required_extensions), file_name))
 
+def replace_extensions(command, extension_map):
+	# Only change extensions at the end of file names. So 'a.o' becomes 'a.obj'
+	# but 'a.other/b' and 'a.o.d' are left alone
+	for before, after in extension_map.items():
+		command = re.sub(re.escape(before) + r'(?=$|[\s"\':;,])', after, command)
+
+	return command
+
 def call_on_exit(cb):
 	# Set a cleanup function to run on exit
 	if cb:
@@ -98,3 +107,42 @@ def get_rscript_line():
 			return '{0} Ln {1}'.format(file, line)
 
 	return '?'
+
+# Returns a list of (header, count) of the headers included by the files, with
+# the most used first. These are the best headers to put in a precompiled
+# header. Headers included in quotes are followed, so the headers they include
+# are counted for every file that uses them.
+def get_headers_by_fan_in(file_names):
+	include_re = re.compile(r'^\s*#\s*include\s*([<"])([^>"]+)[>"]', re.MULTILINE)
+	file_includes = {}
+
+	def get_includes(file_name):
+		# Use the saved includes if the file was already read
+		if file_name in file_includes:
+			return file_includes[file_name]
+		file_includes[file_name] = []
+
+		try:
+			with open(file_name, 'r') as f:
+				code = f.read()
+		except (IOError, OSError):
+			return []
+
+		# Get the includes of this file, and of the local headers it includes
+		includes = []
+		for quote, header in include_re.findall(code):
+			includes.append(header)
+			local_header = os.path.join(os.path.dirname(file_name), header)
+			if quote == '"' and os.path.isfile(local_header):
+				includes += get_includes(local_header)
+
+		file_includes[file_name] = includes
+		return includes
+
+	# Count each header once for each file that uses it
+	counts = {}
+	for file_name in file_names:
+		for header in set(get_includes(file_name)):
+			counts[header] = counts.get(header, 0) + 1
+
+	return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
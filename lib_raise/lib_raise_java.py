@@ -34,8 +34,10 @@ import lib_raise_config as Config
 import lib_raise_users as Users
 import lib_raise_find as Find
 import lib_raise_fs as FS
+import lib_raise_db as DB
 import lib_raise_process as Process
 import lib_raise_helpers as Helpers
+import lib_raise_trace as Trace
 
 from osinfo import *
 import findlib
@@ -146,11 +148,13 @@ class JavaCompiler(object):
 		)
 		command = to_native(command)
 
+		# Get the files the event reads and writes
+		to_update = [to_native(out_file)]
+		triggers = [to_native(t) for t in inc_files + link_files]
+
 		def setup():
 			# Skip if the files have not changed since last build
-			to_update = [to_native(out_file)]
-			triggers = [to_native(t) for t in inc_files + link_files]
-			if not FS.is_outdated(to_update, triggers):
+			if not DB.is_outdated(to_update, triggers, command):
 				return False
 
 			# Create the output directory if it does not exist
@@ -159,7 +163,7 @@ class JavaCompiler(object):
 			return True
 
 		# Create the event
-		event = Process.Event(task, result, plural, singular, command, setup)
+		event = Process.Event(task, result, plural, singular, command, setup, triggers, to_update)
 		Process.add_event(event)
 
 	def build_jar(self, out_file, inc_files, link_files=[]):
@@ -180,11 +184,13 @@ class JavaCompiler(object):
 		)
 		command = to_native(command)
 
+		# Get the files the event reads and writes
+		to_update = [to_native(out_file)]
+		triggers = [to_native(t) for t in inc_files + link_files]
+
 		def setup():
 			# Skip if the files have not changed since last build
-			to_update = [to_native(out_file)]
-			triggers = [to_native(t) for t in inc_files + link_files]
-			if not FS.is_outdated(to_update, triggers):
+			if not DB.is_outdated(to_update, triggers, command):
 				return False
 
 			# Create the output directory if it does not exist
@@ -193,10 +199,11 @@ class JavaCompiler(object):
 			return True
 
 		# Create the event
-		event = Process.Event(task, result, plural, singular, command, setup)
+		event = Process.Event(task, result, plural, singular, command, setup, triggers, to_update, cache=True)
 		Process.add_event(event)
 
 	def run_print(self, command):
+		Process.wait_for_events()
 		Print.status("Running Java program")
 
 		native_command = '{0} {1}'.format(self._runtime, command)
@@ -205,6 +212,7 @@ class JavaCompiler(object):
 		runner.run()
 		runner.is_done
 		runner.wait()
+		FS.clear_stat_cache()
 
 		if runner.is_success or runner.is_warning:
 			Print.ok()
@@ -225,10 +233,7 @@ def to_native(command):
 		'.jar' : '.jar'
 	}
 
-	for before, after in extension_map.items():
-		command = command.replace(before, after)
-
-	return command
+	return Helpers.replace_extensions(command, extension_map)
 
 def get_default_compiler():
 	global java_compilers
@@ -375,4 +380,4 @@ def uninstall_jar(name, dir_name=None):
 				lambda: fn())
 
 
-setup()
+Trace.call('Setting up Java module', 'setup', setup)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# This file is part of Raise.
+# Raise is a small build automation tool that ships with your software.
+# Raise uses a MIT style license, and is hosted at https://github.com/workhorsy/raise .
+# Copyright (c) 2012-2017 Matthew Brennan Jones <matthew.brennan.jones@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+import stat
+import errno
+import select
+import atexit
+import lib_raise_config as Config
+import findlib
+
+
+# The pipe of tokens from the make jobserver, and the tokens we have taken
+read_fd = None
+write_fd = None
+tokens = []
+
+# The pipe, if we are the jobserver
+server_fds = None
+
+
+# GNU make shares its -j jobs with the programs it runs, by putting tokens in a
+# pipe. A program takes a token before running each job past its first, and
+# puts it back when the job is done. The pipe is named in MAKEFLAGS, as
+# --jobserver-auth=R,W for a pipe on file descriptors, or as
+# --jobserver-auth=fifo:PATH for a named pipe. Older versions of make use
+# --jobserver-fds=R,W. When there is no make jobserver, Raise can be one for
+# the make programs it runs. The pipe is passed to every program run, so
+# the make programs can use it.
+def setup():
+	_open_client(os.environ.get('MAKEFLAGS', ''))
+
+def _get_auth(makeflags):
+	# The last one wins, if there are many
+	auth = None
+	for flag in makeflags.split():
+		for prefix in ['--jobserver-auth=', '--jobserver-fds=']:
+			if flag.startswith(prefix):
+				auth = flag[len(prefix) : ]
+	return auth
+
+def _open_client(makeflags):
+	global read_fd
+	global write_fd
+
+	auth = _get_auth(makeflags)
+	if not auth:
+		return
+
+	try:
+		# Open the fifo by name, without blocking
+		if auth.startswith('fifo:'):
+			fd = os.open(auth[len('fifo:') : ], os.O_RDWR | os.O_NONBLOCK)
+			read_fd, write_fd = fd, fd
+		# Or use the pipe, if make passed it to us
+		else:
+			r, w = [int(n) for n in auth.split(',')]
+			if not stat.S_ISFIFO(os.fstat(r).st_mode) or not stat.S_ISFIFO(os.fstat(w).st_mode):
+				return
+			read_fd, write_fd = _open_nonblocking(r), w
+			_pass_to_programs(r, w)
+	except (OSError, ValueError):
+		read_fd, write_fd = None, None
+
+def _open_nonblocking(fd):
+	# Open the pipe again, so it can be read without blocking, and without
+	# changing it for make. Or use it as it is, if we can't
+	try:
+		return os.open('/proc/self/fd/{0}'.format(fd), os.O_RDONLY | os.O_NONBLOCK)
+	except OSError:
+		return fd
+
+def _pass_to_programs(r, w):
+	# Python 3 does not pass file descriptors to programs unless told to
+	for fd in [r, w]:
+		if hasattr(os, 'set_inheritable'):
+			os.set_inheritable(fd, True)
+		if not fd in findlib.inherited_fds:
+			findlib.inherited_fds.append(fd)
+
+def is_enabled():
+	return read_fd != None
+
+def start():
+	# Be the jobserver for make programs, if desired and there is not one already
+	if Config.jobserver and not is_enabled():
+		start_server(Config.jobserver)
+
+def start_server(jobs):
+	global server_fds
+	global read_fd
+	global write_fd
+
+	# The make programs can only be given a pipe on Unix
+	if os.name != 'posix':
+		return
+
+	# Make a pipe with a token for each job past the first
+	r, w = os.pipe()
+	os.write(w, b'+' * (jobs - 1))
+	server_fds = (r, w)
+	read_fd, write_fd = _open_nonblocking(r), w
+	_pass_to_programs(r, w)
+
+	# Tell the make programs we run to use it
+	makeflags = os.environ.get('MAKEFLAGS', '')
+	os.environ['MAKEFLAGS'] = '{0} -j{1} --jobserver-auth={2},{3}'.format(makeflags, jobs, r, w).strip()
+
+def acquire():
+	# Any number of jobs can run if there is no jobserver
+	if not is_enabled():
+		return True
+
+	# Take a token if there is one. The pipe may be blocking if it could not
+	# be opened again, so make sure it has something first
+	try:
+		if not select.select([read_fd], [], [], 0)[0]:
+			return False
+		token = os.read(read_fd, 1)
+	except (OSError, select.error) as err:
+		if err.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+			return False
+		raise
+
+	if not token:
+		return False
+	tokens.append(token)
+	return True
+
+def release(count = 1):
+	# Put tokens back in the pipe, so others can use them. If make closed the
+	# pipe, there is no one to give them to
+	for n in range(min(count, len(tokens))):
+		token = tokens.pop()
+		try:
+			os.write(write_fd, token)
+		except OSError as err:
+			if err.errno not in (errno.EPIPE, errno.EBADF):
+				raise
+
+def get_tokens():
+	return len(tokens)
+
+def exit_module():
+	# Give back all our tokens, so make can use them
+	if tokens:
+		release(len(tokens))
+
+setup()
+atexit.register(exit_module)
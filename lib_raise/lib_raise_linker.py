@@ -30,6 +30,7 @@ import os
 import lib_raise_config as Config
 import lib_raise_users as Users
 import lib_raise_fs as FS
+import lib_raise_db as DB
 import lib_raise_process as Process
 import lib_raise_find as Find
 import lib_raise_terminal as Print
@@ -83,6 +84,9 @@ class Linker(object):
 		self._opt_out_file = out_file
 		self._opt_shared = shared
 
+		# The scheduler pool that links are run in
+		self.link_pool = 'link'
+
 	def get_link(self):
 		return self._name
 	link = property(get_link)
@@ -102,11 +106,13 @@ class Linker(object):
 		)
 		command = to_native(command)
 
+		# Get the files the event reads and writes
+		to_update = [to_native(out_file)]
+		triggers = [to_native(t) for t in obj_files + i_files]
+
 		def setup():
 			# Skip if the files have not changed since last build
-			to_update = [to_native(out_file)]
-			triggers = [to_native(t) for t in obj_files + i_files]
-			if not FS.is_outdated(to_update, triggers):
+			if not DB.is_outdated(to_update, triggers, command):
 				return False
 
 			# Create the output directory if it does not exist
@@ -115,7 +121,7 @@ class Linker(object):
 			return True
 
 		# Create the event
-		event = Process.Event(task, result, plural, singular, command, setup)
+		event = Process.Event(task, result, plural, singular, command, setup, triggers, to_update, pool=self.link_pool)
 		Process.add_event(event)
 
 
@@ -144,10 +150,7 @@ def to_native(command):
 			'.a' : '.a'
 		}
 
-	for before, after in extension_map.items():
-		command = command.replace(before, after)
-
-	return command
+	return Helpers.replace_extensions(command, extension_map)
 
 def get_default_linker():
 	global linkers
@@ -158,6 +161,8 @@ def get_default_linker():
 		return linkers['ld']
 
 def ldconfig():
+	Process.wait_for_events()
+
 	# Setup the message
 	Print.status("Running 'ldconfig'")
 
@@ -25,25 +25,68 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import os, sys
+import os, sys, re
 import subprocess
 import time
+import atexit
 from osinfo import *
 import lib_raise_config as Config
 import lib_raise_helpers as Helpers
 import lib_raise_cpu as CPU
 import lib_raise_users as Users
 import lib_raise_terminal as Print
+import lib_raise_fs as FS
+import lib_raise_db as DB
+import lib_raise_cache as Cache
+import lib_raise_distribute as Distribute
+import lib_raise_jobserver as Jobserver
+import lib_raise_slots as Slots
+import lib_raise_trace as Trace
 
 import findlib
 
 
+# The most objects to build with one compiler process
+max_batch_size = 16
+
+# How many seconds to guess an event takes for each byte of its inputs,
+# when it has not been run before
+seconds_per_input_byte = 0.00001
+
+# How many bytes of memory to guess an event uses, when it has not been run before
+default_job_memory = 256 * 1024 * 1024
+
+# How many seconds a new job takes to use all its memory, so it is counted
+# as if it was before the memory is used
+memory_ramp_time = 5.0
+
+# How many times to run an event again, if it was killed for using too much memory
+max_retries = 2
+
+# Events that use this much memory, or are in the link pool, are spread
+# across the NUMA nodes when jobs are pinned to cpus
+heavy_job_memory = 1024 * 1024 * 1024
+
+# The most events in each pool that can run at once, and how many are running.
+# Events that are not in a pool are only limited by the number of jobs
+pools = { 'link' : 2 }
+pools_used = {}
+
+# With -k, the events that failed, and the ones not built because they use
+# the outputs of a failed event. Shown when the build stops
+failed_events = []
+not_built_events = []
+failed_outputs = set()
+
+
 class Event(object):
 	is_concurrent = False
 	is_first_concurrent = False
 	events = []
+	producers = {}
+	added_count = 0
 
-	def __init__(self, task, result, plural, singular, command, setup_cb):
+	def __init__(self, task, result, plural, singular, command, setup_cb, inputs=[], outputs=[], deps=None, signature=None, cache=False, distribute=None, batch=None, pool=None):
 		self._status = 'ready'
 		self._runner = None
 
@@ -53,12 +96,78 @@ class Event(object):
 		self._singular = singular
 		self._command = command
 		self._setup_cb = setup_cb
+		self._inputs = inputs
+		self._outputs = outputs
+		self._deps = deps
+		self._signature = signature or command
+		self._cache = cache
+		self._distribute = distribute
+		self._batch = batch
+		self._pool = pool
+		self._pool_text = ''
+		self._is_remote = False
+		self._dependencies = []
+		self._start_time = None
+		self._duration = None
+		self._memory_used = None
+		self._retries = 0
+		self._is_alone = False
+		self._pinned = None
+		self._lane = None
+		self._priority = 0
+		self._index = 0
 
 	def get_is_done(self):
+		if self._status == 'success':
+			return True
 		return self._runner.is_done
 	is_done = property(get_is_done)
 
-	def run(self):
+	def get_is_ready(self):
+		# Ready when every event that makes one of our inputs has finished
+		for event in self._dependencies:
+			if not event._status in ['success', 'skipped', 'failure']:
+				return False
+		return True
+	is_ready = property(get_is_ready)
+
+	def get_duration(self):
+		# Use how long it took last time
+		durations = [DB.get_duration(o) for o in self._outputs]
+		durations = [d for d in durations if d != None]
+		if durations:
+			return max(durations)
+
+		# Or guess from the size of the inputs
+		size = 0
+		for file_name in self._inputs:
+			st = FS.get_stat(file_name)
+			if st:
+				size += st.st_size
+		return size * seconds_per_input_byte
+	duration = property(get_duration)
+
+	def get_memory(self):
+		# Use the most memory it used last time, or a guess
+		memories = [DB.get_memory(o) for o in self._outputs]
+		memories = [m for m in memories if m != None]
+		if memories:
+			return max(memories)
+		return default_job_memory
+	memory = property(get_memory)
+
+	def run(self, is_remote = False):
+		if not self.prepare():
+			return False
+
+		self.start(is_remote)
+		return True
+
+	def prepare(self):
+		# Already set up, if it is being run again
+		if self._retries or self._is_alone:
+			return True
+
 		# Show the concurrent header
 		if Event.is_concurrent:
 			if Event.is_first_concurrent:
@@ -69,97 +178,587 @@ class Event(object):
 
 		# Run the setup function
 		if not self._setup_cb():
+			self._status = 'skipped'
 			return False
 
 		# Show the serial message
 		if not Event.is_concurrent:
 			Print.status("{0} {1} '{2}'".format(self._task, self._singular, self._result))
 
-		# Start the process
-		self._runner = findlib.ProcessRunner(self._command)
+		# Use the outputs from the cache if they were built before
+		if self._cache and Cache.is_enabled():
+			start = time.time()
+			cached = Cache.get(self._signature, self._inputs, self._outputs)
+			if cached:
+				lane = Trace.take_lane()
+				Trace.add_span(self._result, 'event', start, time.time(), lane,
+					_get_trace_args(self._command, 'success', 0, False, True))
+				Trace.free_lane(lane)
+				stdout, stderr, deps = cached
+				self._finish(stdout, stderr, deps)
+				return False
+
+		return True
+
+	def start(self, is_remote = False):
+		# Start the process, on a worker if desired
+		self._is_remote = is_remote
+		if is_remote:
+			self._runner = Distribute.RemoteRunner(self._command, self._distribute)
+		else:
+			self._runner = findlib.ProcessRunner(self._command, is_grouped = True, cpus = CPU.get_pinned_cpus(self._pinned))
 		self._status = 'running'
+		self._start_time = time.time()
+		self._lane = Trace.take_lane()
 		self._runner.run()
-		return True
 
 	def wait(self):
 		# Wait for the process to complete
 		self._runner.wait()
+		self._duration = time.time() - self._start_time
+		self._memory_used = self._runner.max_rss
+		Trace.add_span(self._result, 'event', self._start_time, self._start_time + self._duration, self._lane,
+			_get_trace_args(self._command, _get_trace_status(self._runner), self._runner._return_code, self._is_remote, False))
+		Trace.free_lane(self._lane)
+		FS.forget_stats(self._outputs)
+
+		# If it was killed, probably for using too much memory, run it again
+		# later with fewer jobs at once
+		if self._runner.is_killed and self._retries < max_retries:
+			self._retries += 1
+			self._status = 'retry'
+			self._runner = None
+			return
+
+		# Get the headers cl.exe printed, and remove them from the output
+		deps = None
+		if self._deps == 'msvc':
+			deps = _read_show_includes(self._runner)
+
+		# Show the failure. Then keep building anything that does not need
+		# it if -k, or stop the other jobs and exit
+		if self._runner.is_failure:
+			if Event.is_concurrent:
+				Print.status("   '{0}'{1}".format(self._result, self._pool_text))
+			Print.fail(self._runner.stdall)
+			self._status = 'failure'
+			self._runner = None
+			if Config.is_keep_going:
+				failed_events.append(self)
+				_add_failed_outputs(self)
+				return
+			findlib.kill_process_groups()
+			Print.exit("{0} failed. Try again.".format(self._task))
+			return
 
+		# Get the headers the compiler wrote
+		if self._deps == 'gcc':
+			deps = _read_depfile(self._outputs[0] + '.d')
+
+		# Save the outputs in the cache
+		if self._cache and Cache.is_enabled():
+			Cache.put(self._signature, self._inputs, self._outputs,
+					self._runner.stdout, self._runner.stderr, deps)
+
+		self._finish(self._runner.stdout, self._runner.stderr, deps)
+
+	def _finish_batch(self, deps, stderr):
+		FS.forget_stats(self._outputs)
+
+		# Get the headers the compiler wrote
+		if self._deps == 'gcc':
+			deps = _read_depfile(self._batch.depfile)
+
+		# Save the outputs in the cache
+		if self._cache and Cache.is_enabled():
+			Cache.put(self._signature, self._inputs, self._outputs, '', stderr, deps)
+
+		self._finish('', stderr, deps)
+
+	def _finish(self, stdout, stderr, deps):
 		# Display the message
 		if Event.is_concurrent:
-			Print.status("   '{0}'".format(self._result))
+			Print.status("   '{0}'{1}".format(self._result, self._pool_text))
 
-		# Success or failure
-		if self._runner.is_success:
+		# Success or warning
+		if not stderr:
 			Print.ok()
-			self._status = 'success'
-		elif self._runner.is_warning:
-			Print.warning(self._runner.stderr)
-			self._status = 'success'
 		else:
-			Print.fail(self._runner.stdall)
-			Print.exit("{0} failed. Try again.".format(self._task))
-			self._status = 'failure'
+			Print.warning(stderr)
+		self._status = 'success'
+
+		# Save what the outputs were built from
+		DB.save_outputs(self._outputs, self._inputs, self._signature, deps, self._duration, self._memory_used)
+
+		# Let go of the process and its output
+		self._runner = None
+
+
+# Events with the same batch command are built by one process. The command
+# has {sources} where the sources of all the events go
+class Batch(object):
+	def __init__(self, command, source, depfile = None):
+		self.command = command
+		self.source = source
+		self.depfile = depfile
+
+class EventBatch(object):
+	def __init__(self, events):
+		self._events = events
+		self._is_remote = False
+		self._status = 'running'
+		self._pool = events[0]._pool
+		self._pool_text = ''
+		self._pinned = None
+		self._lane = None
+
+		sources = str.join(' ', ['"{0}"'.format(event._batch.source) for event in events])
+		self._command = events[0]._batch.command.replace('{sources}', sources)
+		self._runner = None
+		for event in events:
+			event._status = 'running'
+
+	def get_memory(self):
+		# The sources are built one after the other, so use the most any uses
+		return max([event.memory for event in self._events])
+	memory = property(get_memory)
+
+	def start(self):
+		self._runner = findlib.ProcessRunner(self._command, is_grouped = True, cpus = CPU.get_pinned_cpus(self._pinned))
+		self._start_time = time.time()
+		self._lane = Trace.take_lane()
+		self._runner.run()
+
+	def wait(self):
+		self._runner.wait()
+		duration = (time.time() - self._start_time) / len(self._events)
+		name = str.join(', ', [event._result for event in self._events])
+		Trace.add_span(name, 'event', self._start_time, time.time(), self._lane,
+			_get_trace_args(self._runner._command, _get_trace_status(self._runner), self._runner._return_code, False, False))
+		Trace.free_lane(self._lane)
+
+		# If any failed or were killed, give them back to the scheduler to be
+		# built one at a time. So each error is shown with the object it is for
+		if self._runner.is_failure or self._runner.is_killed:
+			for event in self._events:
+				event._is_alone = True
+				event._status = 'ready'
+			self._status = 'split'
+			return
+
+		# Get the headers cl.exe printed for each source
+		source_deps = {}
+		if self._events[0]._deps == 'msvc':
+			sources = [event._batch.source for event in self._events]
+			source_deps = _read_batch_show_includes(self._runner, sources)
+
+		# Show the warnings once, after the last of the sources
+		for event in self._events:
+			stderr = ''
+			if event is self._events[-1]:
+				stderr = self._runner.stderr
+			event._pool_text = self._pool_text
+			event._duration = duration
+			event._memory_used = self._runner.max_rss
+			event._finish_batch(source_deps.get(event._batch.source), stderr)
+		self._status = 'success'
+
+def _get_trace_status(runner):
+	if runner.is_killed:
+		return 'killed'
+	elif runner.is_failure:
+		return 'failure'
+	elif runner.is_warning:
+		return 'warning'
+	return 'success'
+
+def _get_trace_args(command, status, exit_code, is_remote, is_cached):
+	if isinstance(command, (list, tuple)):
+		command = str.join(' ', command)
 
+	return {
+		'command' : command,
+		'status' : status,
+		'exit_code' : exit_code,
+		'remote' : is_remote,
+		'cached' : is_cached
+	}
+
+def _read_depfile(file_name):
+	if not os.path.isfile(file_name):
+		return None
+
+	# Read the make rule that the compiler wrote, then remove it
+	with open(file_name, 'r') as f:
+		data = f.read()
+	os.remove(file_name)
+
+	# Join the lines, and skip the name of the output before the colon
+	data = data.replace('\\\r\n', ' ').replace('\\\n', ' ')
+	data = data.split(': ', 1)[-1]
+
+	# Split on the spaces that are not escaped
+	deps = re.split(r'(?<!\\)\s+', data.strip())
+	return [dep.replace('\\ ', ' ') for dep in deps if dep]
+
+def _read_show_includes(runner):
+	prefix = 'Note: including file:'
+	deps = []
+	lines = []
+	for line in runner.stdout.splitlines():
+		if line.startswith(prefix):
+			deps.append(line[len(prefix) : ].strip())
+		else:
+			lines.append(line)
+
+	runner._stdout = str.join('\n', lines)
+	return deps
+
+
+def _read_batch_show_includes(runner, sources):
+	# cl.exe prints the name of each source, then the files it includes
+	names = {}
+	for source in sources:
+		names[os.path.basename(source)] = source
+
+	prefix = 'Note: including file:'
+	source_deps = {}
+	deps = []
+	for line in runner.stdout.splitlines():
+		if line.strip() in names:
+			deps = source_deps.setdefault(names[line.strip()], [])
+		elif line.startswith(prefix):
+			deps.append(line[len(prefix) : ].strip())
+
+	return source_deps
+
+def _to_key(file_name):
+	return os.path.normcase(os.path.abspath(file_name))
+
+def set_pool(name, depth):
+	# Add a pool, or change how many of its events can run at once. At least
+	# one must be able to run, or its events would never start
+	if depth < 1:
+		Print.exit("Pool '{0}' must run at least one event at once, not {1}.".format(name, depth))
+	pools[name] = depth
 
 def add_event(event):
+	# Make sure the pool exists
+	if event._pool and not event._pool in pools:
+		Print.exit("No pool named '{0}'. Add it with set_pool.".format(event._pool))
+
+	# Make the event wait on any queued events that build its inputs, or
+	# that build the same outputs before it
+	for file_name in event._inputs + event._outputs:
+		producer = Event.producers.get(_to_key(file_name))
+		if producer and not producer in event._dependencies:
+			event._dependencies.append(producer)
+
+	# Save the event as the one that builds its outputs
+	for file_name in event._outputs:
+		Event.producers[_to_key(file_name)] = event
+
+	event._index = Event.added_count
+	Event.added_count += 1
 	Event.events.append(event)
 
 	# If not concurrent, run the event now
 	if not Event.is_concurrent:
-		concurrent_end()
+		_run_events()
 
 def concurrent_start():
 	Event.is_concurrent = True
 	Event.is_first_concurrent = True
 
 def concurrent_end():
+	# When the whole target is a build graph, events are run
+	# when their outputs are needed. Not at the end of each window
+	if Config.is_concurrent:
+		return
+
+	_run_events()
+
+def wait_for_events():
+	# Run any queued events, so their output files can be used
+	if Event.events:
+		_run_events()
+
+	# Stop if any failed with -k, as what comes next probably needs them
+	if failed_events:
+		_exit_with_failures()
+
+def _exit_with_failures():
+	failed = str.join(', ', ["'{0}'".format(event._result) for event in failed_events])
+	message = "Failed to build {0}.".format(failed)
+	if not_built_events:
+		not_built = str.join(', ', ["'{0}'".format(event._result) for event in not_built_events])
+		message += " Not built, as they need those: {0}.".format(not_built)
+	Print.exit(message)
+
+def _add_failed_outputs(event):
+	for file_name in event._outputs:
+		failed_outputs.add(_to_key(file_name))
+
+def _has_failed_inputs(event):
+	for file_name in event._inputs:
+		if _to_key(file_name) in failed_outputs:
+			return True
+	return False
+
+def _remove_not_buildable_events(ready_events):
+	# Don't build the events that use the outputs of failed events. So the
+	# events that use their outputs are not built either
+	for event in list(ready_events):
+		if event.is_ready and _has_failed_inputs(event):
+			ready_events.remove(event)
+			event._status = 'failure'
+			not_built_events.append(event)
+			_add_failed_outputs(event)
+
+def _run_events():
 	ready_events = Event.events
-	running_events = []
+	running_events = {}
+	start = time.time()
+	count = len(ready_events)
+
+	# Show one header for the whole build graph, as it has many kinds of events
+	if Config.is_concurrent and Event.is_first_concurrent:
+		Event.is_first_concurrent = False
+		sys.stdout.write("Running {0} build events concurrently ...\n".format(count))
+		sys.stdout.flush()
+		Print.message_length = 0
+
+	FS.start_stat_cache()
+	_sort_by_priority(ready_events)
+	_prefetch_cached(ready_events)
+	CPU.start_jobs()
+	Jobserver.start()
+	Slots.start()
 
 	while len(ready_events) or len(running_events):
 		#print(CPU.get_utilization(), CPU.cpus_free)
+		if failed_outputs:
+			_remove_not_buildable_events(ready_events)
+
+		# Send the events that can be built on workers, while they have free slots.
+		# So the local cores are kept for everything else
+		while Distribute.get_slots_free() > 0:
+			event = _get_next_ready_event(ready_events, True)
+			if not event:
+				break
+
+			ready_events.remove(event)
+			if event.run(True):
+				_take_pool(event)
+				running_events[event._runner] = event
+
+		# Check for events that need to start, longest critical path first.
+		# Up to the number of jobs the cpu module says to run
+		while CPU.cpus_free > 0:
+			event = _get_next_ready_event(ready_events)
+			if not event:
+				break
+
+			# Wait for memory to be freed, unless nothing is running
+			if running_events and not _has_memory_for(event, running_events):
+				break
 
-		# Check for events that are done
-		for event in running_events[:]:
-			# Check if it is done
-			if event.is_done:
-				event.wait()
+			# Each job past the first needs a token from the make jobserver
+			if Jobserver.get_tokens() < CPU.jobs_running and not Jobserver.acquire():
+				break
+
+			# And a slot from the slot server shared by all the Raise processes
+			if Slots.get_slots() < CPU.jobs_running and not Slots.acquire():
+				_release_extra_tokens()
+				break
+
+			ready_events.remove(event)
+			if not event.prepare():
+				_release_extra_tokens()
+				continue
+
+			# Build any other ready events with the same flags in the same process.
+			# With the sources in the order they were added
+			events = [event] + _get_batch_events(event, ready_events)
+			if len(events) > 1:
+				events.sort(key=lambda event: event._index)
+				event = EventBatch(events)
+
+			# Pick its cpus before it starts, so the programs it starts use them too
+			CPU.job_started()
+			_take_pool(event)
+			event._pinned = CPU.pin_job(_is_memory_heavy(event))
+			event.start()
+			running_events[event._runner] = event
+
+		if not running_events:
+			continue
+
+		# Wait for any of the events to finish. But wake up to check again,
+		# if there are events that could start
+		timeout = None
+		if CPU.cpus_free > 0 and _get_next_ready_event(ready_events):
+			timeout = CPU.sample_interval
+
+		for runner in findlib.wait_for_any(list(running_events.keys()), timeout):
+			event = running_events.pop(runner)
+			event.wait()
+			_free_pool(event)
+			CPU.unpin_job(event._pinned)
+			event._pinned = None
 
 			# Success. Keep going
 			if event._status == 'success':
-				running_events.remove(event)
-				CPU.cpus_free += 1
-			# Failure. Stop events and exit
+				if not event._is_remote:
+					CPU.job_done()
+			# Killed. Run fewer jobs at once and try it again first
+			elif event._status == 'retry':
+				if not event._is_remote:
+					CPU.job_killed()
+				ready_events.insert(0, event)
+			# Batch failed or was killed. Run each of its events by itself first
+			elif event._status == 'split':
+				if event._runner.is_killed:
+					CPU.job_killed()
+				else:
+					CPU.job_done()
+				ready_events[0:0] = event._events
+			# Failure. Keep going if -k, or stop events and exit
 			elif event._status == 'failure':
-				Print.exit("Event failed.")
+				if not Config.is_keep_going:
+					findlib.kill_process_groups()
+					Print.exit("Event failed.")
+				if not event._is_remote:
+					CPU.job_done()
 
-		# Check for events that need to start
-		while CPU.cpus_free > 0 and CPU.get_utilization() < 90.0 and len(ready_events):
-			event = ready_events.pop()
-			if event.run():
-				CPU.cpus_free -= 1
-				running_events.insert(0, event)
+			_release_extra_tokens()
 
-		# Sleep if all the cpu cores are busy, or have already started
-		if CPU.get_utilization() >= 90.0:
-			time.sleep(0.1)
+	Slots.stop()
+	FS.stop_stat_cache()
+	Trace.add_phase('Running {0} events'.format(count), 'raise', start)
 
 	# Clear all the events
-	CPU.cpus_free = CPU.cpus_total * 10 # 10 jobs per core
 	Event.events = []
-	Event.is_concurrent = False
-	Event.is_first_concurrent = False
+	Event.producers = {}
+	Event.is_concurrent = Config.is_concurrent
+	Event.is_first_concurrent = Config.is_concurrent
+
+def _prefetch_cached(events):
+	# Start looking in the remote cache for the outputs of the events that
+	# need building, in the order they will run. Events that use the outputs
+	# of other events can't be looked up, as their inputs are not built yet
+	if not Cache.is_remote_enabled():
+		return
+
+	for event in events:
+		if event._cache and not event._dependencies and \
+			DB.is_outdated(event._outputs, event._inputs, event._signature, True):
+			Cache.prefetch(event._signature, event._inputs)
+
+def _sort_by_priority(events):
+	# Get the events that use the outputs of each event
+	consumers = {}
+	for event in events:
+		for producer in event._dependencies:
+			consumers.setdefault(id(producer), []).append(event)
+
+	# The priority is the longest time from the event starting, to the end of
+	# the build. Events are always added after the ones they depend on, so
+	# going backwards gets the consumers before their producers
+	for event in reversed(events):
+		later = [consumer._priority for consumer in consumers.get(id(event), [])]
+		event._priority = event.duration + max(later or [0])
+
+	# Start the longest chains first, so they do not finish last
+	events.sort(key=lambda event: -event._priority)
+
+def _release_extra_tokens():
+	# Give back the jobserver tokens and slots that are not needed by the running jobs
+	needed = max(CPU.jobs_running - 1, 0)
+	extra = Jobserver.get_tokens() - needed
+	if extra > 0:
+		Jobserver.release(extra)
+	extra = Slots.get_slots() - needed
+	if extra > 0:
+		Slots.release(extra)
+
+def _has_memory_for(event, running_events):
+	# Count the memory of jobs that started recently, as they may not be
+	# using it all yet
+	now = time.time()
+	size = event.memory
+	for running in running_events.values():
+		if not running._is_remote and now - running._start_time < memory_ramp_time:
+			size += running.memory
+
+	return CPU.has_memory_for(size)
+
+def _get_batch_events(first_event, ready_events):
+	# Events that are run again are run by themselves
+	if not first_event._batch or first_event._retries or first_event._is_alone:
+		return []
+
+	events = []
+	has_workers = Distribute.has_workers()
+	for event in list(ready_events):
+		if len(events) + 1 >= max_batch_size:
+			break
+
+		# Skip the events that can't be built with the first one
+		if not event.is_ready or not event._batch or event._retries or event._is_alone or (event._distribute and has_workers):
+			continue
+		if event._batch.command != first_event._batch.command:
+			continue
+
+		ready_events.remove(event)
+		if event.prepare():
+			events.append(event)
+
+	return events
+
+def _get_next_ready_event(ready_events, is_remote = False):
+	# Events that can be built on workers only go to them, if there are any
+	has_workers = Distribute.has_workers()
+	for event in ready_events:
+		if event.is_ready and bool(event._distribute and has_workers) == is_remote and \
+			not _is_pool_full(event._pool):
+			return event
+
+	return None
+
+def _is_memory_heavy(event):
+	return event._pool == 'link' or event.memory >= heavy_job_memory
+
+def _is_pool_full(name):
+	if not name:
+		return False
+	return pools_used.get(name, 0) >= pools[name]
+
+def _take_pool(event):
+	name = event._pool
+	if not name:
+		return
+
+	# Show how full the pool is, next to the event
+	pools_used[name] = pools_used.get(name, 0) + 1
+	event._pool_text = " [{0} {1}/{2}]".format(name, pools_used[name], pools[name])
+
+def _free_pool(event):
+	if event._pool:
+		pools_used[event._pool] -= 1
 
 def do_on_fail_exit(start_message, fail_message, cb):
+	wait_for_events()
 	Print.status(start_message)
 
 	# Run it if it is a function
 	if hasattr(cb, '__call__'):
 		try:
 			cb()
+			FS.clear_stat_cache()
 			Print.ok()
 		except Exception as e:
+			FS.clear_stat_cache()
 			Print.fail()
 			Print.exit(fail_message)
 	# Or run it as a process if a string
@@ -168,6 +767,7 @@ def do_on_fail_exit(start_message, fail_message, cb):
 		runner.run()
 		runner.is_done
 		runner.wait()
+		FS.clear_stat_cache()
 		if runner.is_success or runner.is_warning:
 			Print.ok()
 		elif runner.is_failure:
@@ -175,9 +775,18 @@ def do_on_fail_exit(start_message, fail_message, cb):
 			Print.exit(fail_message)
 
 def do_on_fail_pass(start_message, cb):
+	wait_for_events()
 	Print.status(start_message)
 	try:
 		cb()
 	except Exception as e:
 		pass
+	FS.clear_stat_cache()
 	Print.ok()
+
+def exit_module():
+	# Stop any jobs still running, such as when exiting on a failure or
+	# by the keyboard. So they don't keep using the cpus
+	findlib.kill_process_groups()
+
+atexit.register(exit_module)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# This file is part of Raise.
+# Raise is a small build automation tool that ships with your software.
+# Raise uses a MIT style license, and is hosted at https://github.com/workhorsy/raise .
+# Copyright (c) 2012-2017 Matthew Brennan Jones <matthew.brennan.jones@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os, sys
+import socket
+import subprocess
+import tempfile
+import time
+import atexit
+import lib_raise_config as Config
+import lib_raise_cpu as CPU
+import slot_server
+
+
+# How long to wait for the slot server to start
+start_timeout = 5.0
+
+# How long the slot server waits for new clients, before exiting
+idle_timeout = 60.0
+
+client = None
+slots = 0
+is_broken = False
+
+
+# When enabled, all the Raise processes on a host share the cpus through a
+# slot_server. The server is started by the first process that needs it, and
+# exits on its own once no processes are using it. If it can't be reached,
+# the process runs without it.
+def setup():
+	pass
+
+def is_enabled():
+	if not hasattr(socket, 'AF_UNIX') or is_broken:
+		return False
+	return Config.slot_server or os.environ.get('RAISE_SLOT_SERVER') == '1'
+
+def get_socket_file():
+	# Use another server if desired
+	if os.environ.get('RAISE_SLOT_SOCKET'):
+		return os.environ['RAISE_SLOT_SOCKET']
+
+	# Or one server for each user
+	uid = os.getuid() if hasattr(os, 'getuid') else 0
+	return os.path.join(tempfile.gettempdir(), 'raise-slots-{0}.sock'.format(uid))
+
+def _start_server(socket_file):
+	# Start the server in its own session, so it outlives this process
+	server_file = os.path.join(os.path.dirname(os.path.abspath(slot_server.__file__)), 'slot_server.py')
+	with open(os.devnull, 'r+b') as devnull:
+		subprocess.Popen(
+			[sys.executable, server_file, socket_file, str(CPU.cpus_available), str(idle_timeout)],
+			stdin = devnull,
+			stdout = devnull,
+			stderr = devnull,
+			close_fds = True,
+			preexec_fn = os.setsid
+		)
+
+def _connect():
+	socket_file = get_socket_file()
+
+	# Use the server if it is running
+	try:
+		return slot_server.SlotClient(socket_file)
+	except socket.error:
+		pass
+
+	# Or start it, and wait for it to listen
+	_start_server(socket_file)
+	deadline = time.time() + start_timeout
+	while time.time() < deadline:
+		time.sleep(0.05)
+		try:
+			return slot_server.SlotClient(socket_file)
+		except socket.error:
+			pass
+
+	return None
+
+def start():
+	global client
+	global is_broken
+
+	if client or not is_enabled():
+		return
+
+	client = _connect()
+	if not client:
+		is_broken = True
+
+def stop():
+	global client
+	global slots
+
+	# Disconnecting frees all our slots
+	if client:
+		client.close()
+		client = None
+	slots = 0
+
+def _fail():
+	# Run without the server, if it stops working
+	global is_broken
+
+	stop()
+	is_broken = True
+
+def acquire():
+	global slots
+
+	# Any number of jobs can run if there is no server
+	if not client:
+		return True
+
+	try:
+		if not client.acquire():
+			return False
+	except socket.error:
+		_fail()
+		return True
+
+	slots += 1
+	return True
+
+def release(count = 1):
+	global slots
+
+	if not client:
+		return
+
+	try:
+		for n in range(min(count, slots)):
+			client.release()
+			slots -= 1
+	except socket.error:
+		_fail()
+
+def get_slots():
+	return slots
+
+def exit_module():
+	stop()
+
+setup()
+atexit.register(exit_module)
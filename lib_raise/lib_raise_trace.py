@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# This file is part of Raise.
+# Raise is a small build automation tool that ships with your software.
+# Raise uses a MIT style license, and is hosted at https://github.com/workhorsy/raise .
+# Copyright (c) 2012-2017 Matthew Brennan Jones <matthew.brennan.jones@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+import json
+import time
+import atexit
+import lib_raise_config as Config
+
+
+# The spans recorded, and when Raise started, as the times are from it
+trace_events = []
+start_time = time.time()
+
+# Which lanes have an event running in them. Lane 0 is for Raise itself
+lanes_used = []
+
+
+# With -trace=FILE, how long the build events and the parts of Raise take is
+# saved as Chrome trace event JSON. It can be opened in chrome://tracing or
+# Perfetto. Each running event is shown on its own lane, so the times when
+# few events run at once stand out.
+def setup():
+	pass
+
+def is_enabled():
+	return Config.trace_file != None
+
+def add_span(name, category, start, end, lane = 0, args = None):
+	if not is_enabled():
+		return
+
+	trace_events.append({
+		'name' : name,
+		'cat' : category,
+		'ph' : 'X',
+		'ts' : int((start - start_time) * 1000000),
+		'dur' : int((end - start) * 1000000),
+		'pid' : os.getpid(),
+		'tid' : lane,
+		'args' : args or {}
+	})
+
+def add_phase(name, category, start):
+	# A part of Raise that started at start, and just ended
+	add_span(name, category, start, time.time())
+
+def call(name, category, cb):
+	# Run the callback, and save how long it took
+	start = time.time()
+	try:
+		return cb()
+	finally:
+		add_phase(name, category, start)
+
+def take_lane():
+	# Use the lowest lane that is free
+	lane = 1
+	while lane in lanes_used:
+		lane += 1
+	lanes_used.append(lane)
+	return lane
+
+def free_lane(lane):
+	if lane in lanes_used:
+		lanes_used.remove(lane)
+
+def _get_lane_names():
+	# Name the lanes, so the viewer does not just show numbers
+	lanes = sorted(set([event['tid'] for event in trace_events] + [0]))
+	names = []
+	for lane in lanes:
+		names.append({
+			'name' : 'thread_name',
+			'ph' : 'M',
+			'pid' : os.getpid(),
+			'tid' : lane,
+			'args' : { 'name' : 'Raise' if lane == 0 else 'Job {0}'.format(lane) }
+		})
+	return names
+
+def save():
+	if not is_enabled():
+		return
+
+	data = {
+		'traceEvents' : _get_lane_names() + trace_events,
+		'displayTimeUnit' : 'ms'
+	}
+	with open(Config.trace_file, 'w') as f:
+		json.dump(data, f)
+
+def exit_module():
+	save()
+
+setup()
+atexit.register(exit_module)
@@ -51,6 +51,7 @@ def get_normal_user_id():
 	return int(os.popen('id -u {0}'.format(user_name)).read())
 
 def do_as_normal_user(cb):
+	import lib_raise_process as Process
 	prev_id = -1
 
 	# Change the user to the normal user
@@ -65,6 +66,7 @@ def do_as_normal_user(cb):
 	is_exiting = False
 	try:
 		cb()
+		Process.wait_for_events()
 	except SystemExit as err:
 		# Don't save any exit() exceptions. Just exit
 		is_exiting = True
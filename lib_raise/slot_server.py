@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Copyright (c) 2013-2014, Matthew Brennan Jones <matthew.brennan.jones@gmail.com>
+# Py-findlib is for finding libraries and programs on most operating systems
+# It uses a MIT style license
+# It is hosted at: https://github.com/workhorsy/py-findlib
+# 
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os, sys
+import errno
+import socket
+import select
+import time
+import logging
+import multiprocessing
+
+
+# Gives out job slots to all the Raise processes on a host, so they share the
+# cpus instead of each one using all of them. Clients connect on a Unix socket
+# and keep the connection while building. Each client runs one job for free,
+# and asks for a slot for each other job. Each client gets at most its share
+# of the slots, so they all get some. The slots of a client are freed when it
+# disconnects, even if it crashed. The server exits when it has had no clients
+# for idle_timeout seconds.
+class SlotServer(object):
+	def __init__(self, socket_file, slots = None, idle_timeout = 60.0):
+		self.logger = logging.getLogger('slot_server')
+		self.socket_file = socket_file
+		self.slots = slots or multiprocessing.cpu_count()
+		self.idle_timeout = idle_timeout
+		self.clients = {}
+		self.buffers = {}
+
+	def start(self):
+		self.listen()
+		self.serve()
+
+	def listen(self):
+		# Remove the socket file if it is left over from a server that is gone
+		if os.path.exists(self.socket_file):
+			try:
+				sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+				sock.connect(self.socket_file)
+				sock.close()
+				raise Exception('There is already a slot server on {0}'.format(self.socket_file))
+			except socket.error:
+				os.remove(self.socket_file)
+
+		self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.socket.bind(self.socket_file)
+		os.chmod(self.socket_file, 0o600)
+		self.socket.listen(16)
+		self.logger.debug('Listening on %r with %r slots', self.socket_file, self.slots)
+
+	def serve(self):
+		idle_since = time.time()
+		try:
+			while self.clients or time.time() - idle_since < self.idle_timeout:
+				socks = [self.socket] + list(self.clients.keys())
+				ready = select.select(socks, [], [], 1.0)[0]
+				for sock in ready:
+					if sock is self.socket:
+						conn, address = self.socket.accept()
+						self.clients[conn] = 0
+						self.buffers[conn] = b''
+					else:
+						self.on_client_data(sock)
+
+				if self.clients:
+					idle_since = time.time()
+		finally:
+			self.socket.close()
+			if os.path.exists(self.socket_file):
+				os.remove(self.socket_file)
+
+	def on_client_data(self, conn):
+		try:
+			chunk = conn.recv(1024)
+		except socket.error:
+			chunk = b''
+
+		# The client is gone, so free its slots
+		if not chunk:
+			self.clients.pop(conn, None)
+			self.buffers.pop(conn, None)
+			conn.close()
+			return
+
+		# Answer each full line
+		self.buffers[conn] += chunk
+		while b'\n' in self.buffers[conn]:
+			line, self.buffers[conn] = self.buffers[conn].split(b'\n', 1)
+			if line == b'acquire':
+				conn.sendall(b'yes\n' if self.acquire(conn) else b'no\n')
+			elif line == b'release':
+				self.clients[conn] = max(self.clients[conn] - 1, 0)
+				conn.sendall(b'ok\n')
+			else:
+				conn.sendall(b'fail\n')
+
+	def acquire(self, conn):
+		# Every client runs one job without a slot
+		used = sum(self.clients.values()) + len(self.clients)
+		if used >= self.slots:
+			return False
+
+		# Don't give a client more than its share of the slots
+		share = max(-(-self.slots // len(self.clients)), 1)
+		if self.clients[conn] + 1 >= share:
+			return False
+
+		self.clients[conn] += 1
+		return True
+
+class SlotClient(object):
+	def __init__(self, socket_file, timeout = 5.0):
+		self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.sock.settimeout(timeout)
+		self.sock.connect(socket_file)
+		self.buffer = b''
+
+	def acquire(self):
+		return self._request(b'acquire') == b'yes'
+
+	def release(self):
+		self._request(b'release')
+
+	def close(self):
+		self.sock.close()
+
+	def _request(self, line):
+		self.sock.sendall(line + b'\n')
+		while not b'\n' in self.buffer:
+			chunk = self.sock.recv(1024)
+			if not chunk:
+				raise socket.error(errno.ECONNRESET, 'The slot server closed the connection')
+			self.buffer += chunk
+		reply, self.buffer = self.buffer.split(b'\n', 1)
+		return reply
+
+if __name__ == '__main__':
+	logging.basicConfig(level=logging.INFO)
+	socket_file = sys.argv[1]
+	slots = None
+	if len(sys.argv) > 2:
+		slots = int(sys.argv[2])
+	idle_timeout = 60.0
+	if len(sys.argv) > 3:
+		idle_timeout = float(sys.argv[3])
+	server = SlotServer(socket_file, slots, idle_timeout)
+	try:
+		logging.info('Listening')
+		server.start()
+	except:
+		logging.exception('Unexpected exception')
+	finally:
+		logging.info('Shutting down')
+	logging.info('All done')
@@ -369,6 +369,118 @@ Install the program 'no_such_program' and try again. Exiting ...'''
 
 		self.assert_process_output(command, expected, is_success = False)
 
+	def test_events_ordered(self):
+		command = '{0} raise -plain -nolineno events_ordered'.format(sys.executable)
+
+		expected = \
+'''Running target 'events_ordered'
+Making files concurrently ...
+   'a.txt' ...                                                              :)
+   'b.txt' ...                                                              :)
+made a
+True'''
+
+		self.assert_process_output(command, expected)
+
+	def test_events_batched_warning(self):
+		command = '{0} raise -plain -nolineno events_batched_warning'.format(sys.executable)
+
+		expected = \
+'''Running target 'events_batched_warning'
+Making files concurrently ...
+   'a.o' ...                                                                :)
+   'b.o' ...................................................................:\\
+careful
+[True, True]'''
+
+		self.assert_process_output(command, expected)
+
+	def test_events_batched_failure(self):
+		command = '{0} raise -plain -nolineno -k events_batched_failure'.format(sys.executable)
+
+		expected = \
+'''Running target 'events_batched_failure'
+Making files concurrently ...
+   'a.o' ...                                                                :)
+   'b.o' ...................................................................:(
+broken
+
+Failed to build 'b.o'. Exiting ...'''
+
+		self.assert_process_output(command, expected, is_success=False)
+
+	def test_output_spilled(self):
+		command = '{0} raise -plain -nolineno output_spilled'.format(sys.executable)
+
+		expected = \
+'''Running target 'output_spilled'
+True
+True
+True
+True'''
+
+		self.assert_process_output(command, expected)
+
+	def test_pool_empty(self):
+		command = '{0} raise -plain -nolineno pool_empty'.format(sys.executable)
+
+		expected = \
+'''Running target 'pool_empty'
+Pool 'empty' must run at least one event at once, not 0. Exiting ...'''
+
+		self.assert_process_output(command, expected, is_success=False)
+
+	def test_cgroup_cpus(self):
+		command = '{0} raise -plain -nolineno cgroup_cpus'.format(sys.executable)
+
+		expected = \
+'''Running target 'cgroup_cpus'
+None
+2
+3
+3
+None'''
+
+		self.assert_process_output(command, expected)
+
+	def test_jobs_invalid(self):
+		command = '{0} raise -plain -nolineno -j=x simple_nothing'.format(sys.executable)
+
+		expected = \
+"The option '-j' must be a number of 1 or more, not 'x'. Exiting ..."
+
+		self.assert_process_output(command, expected, False)
+
+		command = '{0} raise -plain -nolineno -j=2 -jmin=3 simple_nothing'.format(sys.executable)
+
+		expected = \
+"The option '-jmin' can't be more than '-j'. Exiting ..."
+
+		self.assert_process_output(command, expected, False)
+
+	def test_signal_stops_jobs(self):
+		command = '{0} raise -plain -nolineno signal_stops_jobs'.format(sys.executable)
+
+		expected = \
+'''Running target 'signal_stops_jobs'
+Running program 'job' ...Exit called by signal 15. Exiting ...
+False
+Running program 'job' ...Exit called by signal 1. Exiting ...
+False'''
+
+		self.assert_process_output(command, expected)
+
+	def test_cpu_utilization(self):
+		command = '{0} raise -plain -nolineno cpu_utilization'.format(sys.executable)
+
+		expected = \
+'''Running target 'cpu_utilization'
+True
+True
+True'''
+
+		self.assert_process_output(command, expected)
+
 	def test_require_not_root(self):
 		command = '{0} raise -plain -nolineno simple_require_not_root'.format(sys.executable)
 
@@ -471,6 +583,429 @@ Running C program ...                                                       :)
 
 			self.assert_process_output(command, expected)
 
+	def test_build_cached(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -arg={1} build_cached'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_cached'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building C object 'lib_math.o' ...                                          :)
+Building C object 'main.o' ...                                              :)
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building C object 'lib_math.o' ...                                          :)
+Building C object 'main.o' ...                                              :)
+Building C program 'main.exe' ...                                           :)
+Running C program ...                                                       :)
+./main.exe
+7 * 12 = 84'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_remote_cached(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -arg={1} build_remote_cached'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_remote_cached'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building C objects concurrently ...
+   'lib_math.o' ...                                                         :)
+   'main.o' ...                                                             :)
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+2
+Building C objects concurrently ...
+   'lib_math.o' ...                                                         :)
+   'main.o' ...                                                             :)
+Building C program 'main.exe' ...                                           :)
+Running C program ...                                                       :)
+./main.exe
+7 * 12 = 84
+False'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_remote_cache_down(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -arg={1} build_remote_cache_down'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_remote_cache_down'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building C objects concurrently ...
+   'lib_math.o' ...                                                         :)
+   'main.o' ...                                                             :)
+True'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_distributed(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -arg={1} build_distributed'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_distributed'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building C object 'lib_math.o' ...                                          :)
+Building C object 'main.o' ...                                              :)
+Building C program 'main.exe' ...                                           :)
+Running C program ...                                                       :)
+./main.exe
+7 * 12 = 84
+2
+Argument not allowed: -wrapper
+Argument not allowed: -fplugin=evil
+Argument not allowed: -B/tmp
+Argument not allowed: @flags.txt
+2'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_unity(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -arg={1} build_unity'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_unity'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building C object 'all_unity0.o' ...                                        :)
+Building C program 'main.exe' ...                                           :)
+Running C program ...                                                       :)
+./main.exe
+7 * 12 = 84
+[['big.c'], ['small1.c', 'small2.c']]'''
+
+			self.assert_process_output(command, expected)
+
+	def test_native_names(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -arg={1} native_names'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'native_names'
+gcc -c foo.other/x.c -o foo.other/x.obj -MF foo.other/x.o.d
+"foo.other/x.obj" foo.other/main.exe foo.so.1/x.dll
+gcc -c foo.other/x.c -o foo.other/x.o -MF foo.other/x.o.d
+"foo.other/x.o" foo.other/main foo.so.1/x.so'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_batched(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -arg={1} build_batched'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_batched'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Making the dir 'src dir' ...                                                :)
+Copying the file 'lib_math.c' to 'src dir/lib_math.c' ...                   :)
+Copying the file 'main.c' to 'src dir/main.c' ...                           :)
+Building C objects concurrently ...
+   'lib_math.o' ...                                                         :)
+   'main.o' ...                                                             :)
+Removing the dir 'src dir' ...                                              :)
+Building C program 'main.exe' ...                                           :)
+Running C program ...                                                       :)
+./main.exe
+7 * 12 = 84
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building C objects concurrently ...
+   'lib_math.o' ...                                                         :)
+   'main.o' ...                                                             :)
+True'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_duration_saved(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -arg={1} build_duration_saved'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_duration_saved'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building C object 'lib_math.o' ...                                          :)
+Building C object 'main.o' ...                                              :)
+Building C program 'main.exe' ...                                           :)
+[True, True, True]'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_killed_retried(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -arg={1} build_killed_retried'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_killed_retried'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Running command 'retried.txt' ...                                           :)
+retried'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_pool(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -arg={1} build_pool'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_pool'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building C objects concurrently ...
+   'lib_math.o' [heavy 1/1] ...                                             :)
+   'main.o' [heavy 1/1] ...                                                 :)
+Building C program 'main.exe' ...                                           :)
+Running C program ...                                                       :)
+./main.exe
+7 * 12 = 84'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_jobserver(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -jobserver=2 -arg={1} build_jobserver'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_jobserver'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building C object 'lib_math.o' ...                                          :)
+True'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_jobserver_make(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -jobserver=2 -arg={1} build_jobserver_make'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_jobserver_make'
+Running program 'make' ...                                                  :)
+2'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_jobserver_client(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -arg={1} build_jobserver_client'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_jobserver_client'
+True
+2
+True
+0'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_slot_server(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -slot_server -arg={1} build_slot_server'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_slot_server'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building C objects concurrently ...
+   'lib_math.o' ...                                                         :)
+   'main.o' ...                                                             :)
+Building C program 'main.exe' ...                                           :)
+Running C program ...                                                       :)
+./main.exe
+7 * 12 = 84
+True
+False'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_cpus_available(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -arg={1} build_cpus_available'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_cpus_available'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building C objects concurrently ...
+   'lib_math.o' ...                                                         :)
+   'main.o' ...                                                             :)
+True
+True'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_pinned(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -pin -arg={1} build_pinned'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_pinned'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building C objects concurrently ...
+   'lib_math.o' ...                                                         :)
+   'main.o' ...                                                             :)
+Building C program 'main.exe' ...                                           :)
+Running C program ...                                                       :)
+./main.exe
+7 * 12 = 84
+True
+True
+Running program 'affinity.txt' ...                                          :)
+True'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_keep_going(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -k -arg={1} build_keep_going'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_keep_going'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building object 'broken.o' .................................................:(
+
+
+Building C object 'lib_math.o' ...                                          :)
+Failed to build 'broken.o'. Not built, as they need those: 'broken.exe'. Exiting ...'''
+
+			self.assert_process_output(command, expected, is_success = False)
+
+	def test_build_fail_fast(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -jmin=2 -arg={1} build_fail_fast'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_fail_fast'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building objects concurrently ...
+   'broken.o' ..............................................................:(
+
+
+Building failed. Try again. Exiting ...
+True'''
+
+			self.assert_process_output(command, expected, is_success = False)
+
+	def test_build_trace(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -trace=trace.json -arg={1} build_trace'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_trace'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building C object 'lib_math.o' ...                                          :)
+Building C object 'main.o' ...                                              :)
+Building C program 'main.exe' ...                                           :)
+['lib_math.o', 'main.o', 'main.exe']
+['event', 'find', 'raise', 'setup']'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_db_torn(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -arg={1} build_db_torn'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_db_torn'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building C object 'lib_math.o' ...                                          :)
+Building C object 'main.o' ...                                              :)
+True
+[True, True]'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_touched(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -arg={1} build_touched'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_touched'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building C object 'lib_math.o' ...                                          :)
+Building C object 'lib_math.o' ...                                          :)'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_rewritten(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -arg={1} build_rewritten'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_rewritten'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building C object 'gen.o' ...                                               :)
+Building C object 'gen.o' ...                                               :)'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_flags_changed(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -arg={1} build_flags_changed'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_flags_changed'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building C object 'lib_math.o' ...                                          :)
+Building C object 'lib_math.o' ...                                          :)'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_concurrent(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -concurrent -arg={1} build_shared_library'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_shared_library'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Running 3 build events concurrently ...
+   'lib_math.o' ...                                                         :)
+   'lib_math.so' [link 1/2] ...                                             :)
+   'main.exe' [link 1/2] ...                                                :)
+Running C program ...                                                       :)
+./main.exe
+7 * 12 = 84'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_jobs_limited(self):
+		for prog in TestC.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -concurrent -j=1 -arg={1} build_shared_library'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_shared_library'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Running 3 build events concurrently ...
+   'lib_math.o' ...                                                         :)
+   'lib_math.so' [link 1/2] ...                                             :)
+   'main.exe' [link 1/2] ...                                                :)
+Running C program ...                                                       :)
+./main.exe
+7 * 12 = 84
+Most jobs run at once: 1. Settled on: 1.'''
+
+			self.assert_process_output(command, expected)
+
 
 class TestD(TestCase):
 	found_prereqs = D.d_compilers.keys()
@@ -640,6 +1175,39 @@ Running C++ program ...                                                     :)
 
 			self.assert_process_output(command, expected)
 
+	def test_build_precompiled_header(self):
+		for prog in TestCXX.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -arg={1} build_precompiled_header'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_precompiled_header'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Removing binaries 'pch' ...                                                 :)
+[('lib_math.h', 2), ('iostream', 1)]
+Building C++ precompiled header 'pch.h' ...                                 :)
+Building C++ object 'lib_math.o' ...                                        :)
+Building C++ object 'main.o' ...                                            :)
+Building C++ program 'main.exe' ...                                         :)
+Running C++ program ...                                                     :)
+./main.exe
+7 + 9 = 16'''
+
+			self.assert_process_output(command, expected)
+
+	def test_build_header_touched(self):
+		for prog in TestCXX.get_found_prereqs():
+			command = '{0} raise -plain -nolineno -arg={1} build_header_touched'.format(sys.executable, prog)
+
+			expected = \
+'''Running target 'build_header_touched'
+Removing binaries 'lib_math' ...                                            :)
+Removing binaries 'main' ...                                                :)
+Building C++ object 'main.o' ...                                            :)
+Building C++ object 'main.o' ...                                            :)'''
+
+			self.assert_process_output(command, expected)
+
 
 class TestCSharp(TestCase):
 	found_prereqs = CSharp.cs_compilers.keys()